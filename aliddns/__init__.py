@@ -5,7 +5,9 @@ import voluptuous as vol
 
 from homeassistant.helpers import config_validation as cv
 from homeassistant.helpers.discovery import async_load_platform
-from homeassistant.const import CONF_NAME
+from homeassistant.const import CONF_NAME, CONF_TYPE
+
+from .records import DdnsRecord
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -13,9 +15,26 @@ CONF_ACCESS_ID = 'access_id'
 CONF_ACCESS_KEY = 'access_key'
 CONF_DOMAIN = 'domain'
 CONF_SUB_DOMAIN = 'sub_domain'
+CONF_RECONCILE_INTERVAL = 'reconcile_interval'
+CONF_RECORDS = 'records'
+CONF_IP_TIMEOUT = 'ip_timeout'
+CONF_IP_QUORUM = 'ip_quorum'
 
 DOMAIN = "aliddns"
 DATA_ALIDDNS = DOMAIN
+DEFAULT_RECONCILE_INTERVAL = 3600
+DEFAULT_IP_TIMEOUT = 5
+DEFAULT_IP_QUORUM = 1
+RECORD_TYPES = ["A", "AAAA"]
+SINGLE_RECORD_GROUP = "domain and sub domain"
+
+RECORD_CONFIG = vol.Schema(
+    {
+        vol.Required(CONF_DOMAIN): cv.string,
+        vol.Required(CONF_SUB_DOMAIN): cv.string,
+        vol.Optional(CONF_TYPE, default="A"): vol.In(RECORD_TYPES),
+    }
+)
 
 CONFIG_SCHEMA = vol.Schema(
     {
@@ -24,8 +43,15 @@ CONFIG_SCHEMA = vol.Schema(
                 vol.Required(CONF_NAME): cv.string,
                 vol.Required(CONF_ACCESS_ID): cv.string,
                 vol.Required(CONF_ACCESS_KEY): cv.string,
-                vol.Required(CONF_DOMAIN): cv.string,
-                vol.Required(CONF_SUB_DOMAIN): cv.string,
+                vol.Inclusive(CONF_DOMAIN, SINGLE_RECORD_GROUP): cv.string,
+                vol.Inclusive(CONF_SUB_DOMAIN, SINGLE_RECORD_GROUP): cv.string,
+                vol.Optional(CONF_RECORDS, default=[]): vol.All(
+                    cv.ensure_list, [RECORD_CONFIG]),
+                vol.Optional(CONF_RECONCILE_INTERVAL,
+                    default=DEFAULT_RECONCILE_INTERVAL): cv.positive_int,
+                vol.Optional(CONF_IP_TIMEOUT, default=DEFAULT_IP_TIMEOUT): cv.positive_int,
+                vol.Optional(CONF_IP_QUORUM, default=DEFAULT_IP_QUORUM): vol.All(
+                    vol.Coerce(int), vol.Range(min=1)),
             }
         )
     },
@@ -43,6 +69,12 @@ class AliddnsConfig:
         self._domain = domain
         self._sub_domain = sub_domain
         self._name = conf_name
+        self._reconcile_interval = DEFAULT_RECONCILE_INTERVAL
+        self._records = []
+        self._ip_timeout = DEFAULT_IP_TIMEOUT
+        self._ip_quorum = DEFAULT_IP_QUORUM
+        if domain and sub_domain:
+            self._records.append(DdnsRecord(domain, sub_domain, "A"))
 
     @property
     def name(self):
@@ -69,6 +101,40 @@ class AliddnsConfig:
         """Return the name of the ddns."""
         return self._access_key
 
+    @property
+    def records(self):
+        """Return the records to keep up to date."""
+        return self._records
+
+    @property
+    def ip_timeout(self):
+        """Return the timeout of each public ip provider."""
+        return self._ip_timeout
+
+    @property
+    def ip_quorum(self):
+        """Return how many providers must agree on the public ip."""
+        return self._ip_quorum
+
+    @property
+    def reconcile_interval(self):
+        """Return the interval to read the record back from Aliyun."""
+        return self._reconcile_interval
+
+    def set_reconcile_interval(self, interval):
+        self._reconcile_interval = interval
+
+    def set_ip_detection(self, timeout, quorum):
+        self._ip_timeout = timeout
+        self._ip_quorum = quorum
+
+    def add_records(self, records_conf):
+        for record_conf in records_conf:
+            record = DdnsRecord(record_conf[CONF_DOMAIN],
+                record_conf[CONF_SUB_DOMAIN], record_conf[CONF_TYPE])
+            if record not in self._records:
+                self._records.append(record)
+
 
 async def async_setup(hass, config):
     """Set up the asusrouter component."""
@@ -81,10 +147,14 @@ async def async_setup(hass, config):
         hass.data[DATA_ALIDDNS] = AliddnsConfig(
             conf[CONF_ACCESS_ID],
             conf[CONF_ACCESS_KEY],
-            conf[CONF_DOMAIN],
-            conf[CONF_SUB_DOMAIN],
+            conf.get(CONF_DOMAIN),
+            conf.get(CONF_SUB_DOMAIN),
             conf[CONF_NAME]
         )
+        hass.data[DATA_ALIDDNS].add_records(conf[CONF_RECORDS])
+        hass.data[DATA_ALIDDNS].set_ip_detection(conf[CONF_IP_TIMEOUT],
+            conf[CONF_IP_QUORUM])
+        hass.data[DATA_ALIDDNS].set_reconcile_interval(conf[CONF_RECONCILE_INTERVAL])
 
     hass.async_create_task(
         async_load_platform(hass, "sensor", DOMAIN, {}, config)
@@ -0,0 +1,130 @@
+"""Async client for the Aliyun DNS api."""
+import base64
+import hmac
+import logging
+from collections import namedtuple
+from datetime import datetime
+from hashlib import sha1
+from random import randint
+from urllib.parse import quote
+
+import aiohttp
+from yarl import URL
+
+_LOGGER = logging.getLogger(__name__)
+
+ALIYUN_API_URL = "https://alidns.aliyuncs.com/"
+ALIYUN_API_VERSION = "2015-01-09"
+
+DEFAULT_TIMEOUT = 10  # Default 10s
+DEFAULT_PAGE_SIZE = 500
+
+DomainRecord = namedtuple(
+    "DomainRecord", ["record_id", "domain", "rr", "type", "value", "ttl", "status"])
+
+
+class AliyunApiError(Exception):
+    """Error answered by the Aliyun api."""
+
+    def __init__(self, action, code, message):
+        super().__init__("%s failed, %s : %s" % (action, code, message))
+        self.action = action
+        self.code = code
+        self.message = message
+
+
+def percent_encode(value):
+    """Encode a value as the Aliyun signature expects."""
+    res = quote(str(value).encode('utf-8'), '')
+    res = res.replace('+', '%20')
+    res = res.replace('*', '%2A')
+    res = res.replace('%7E', '~')
+    return res
+
+
+def to_domain_record(record):
+    """Return the DomainRecord of an api record."""
+    return DomainRecord(
+        record.get('RecordId'),
+        record.get('DomainName'),
+        record.get('RR'),
+        record.get('Type'),
+        record.get('Value'),
+        record.get('TTL'),
+        record.get('Status'),
+    )
+
+
+class AliyunDnsClient:
+    """Sign and send Aliyun DNS api calls on a shared aiohttp session."""
+
+    def __init__(self, session, access_id, access_key, timeout=DEFAULT_TIMEOUT):
+        """Init the client, the session keeps the connections alive."""
+        self._session = session
+        self._access_id = access_id
+        self._access_key = access_key
+        self._timeout = aiohttp.ClientTimeout(total=timeout)
+
+    def sign(self, parameters):
+        """Return the signature of the parameters."""
+        canonicalized = '&'.join("%s=%s" % (percent_encode(k), percent_encode(v))
+            for k, v in sorted(parameters.items()))
+        string_to_sign = 'GET&%2F&' + percent_encode(canonicalized)
+        digest = hmac.new((self._access_key + "&").encode('utf-8'),
+            string_to_sign.encode('utf-8'), sha1).digest()
+        return base64.b64encode(digest).decode()
+
+    def build_url(self, action, params):
+        """Return the signed url of an action."""
+        parameters = {
+            'Format': 'json',
+            'Version': ALIYUN_API_VERSION,
+            'AccessKeyId': self._access_id,
+            'SignatureMethod': 'HMAC-SHA1',
+            'Timestamp': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'SignatureVersion': '1.0',
+            'SignatureNonce': randint(0, 99999999999999),
+            'Action': action,
+        }
+        parameters.update(params)
+        parameters['Signature'] = self.sign(parameters)
+
+        query = '&'.join("%s=%s" % (percent_encode(k), percent_encode(v))
+            for k, v in parameters.items())
+        return URL(ALIYUN_API_URL + "?" + query, encoded=True)
+
+    async def async_request(self, action, **params):
+        """Call an action and return the decoded answer."""
+        async with self._session.get(self.build_url(action, params),
+                timeout=self._timeout) as response:
+            result = await response.json(content_type=None)
+
+        if response.status != 200 or 'Code' in result:
+            raise AliyunApiError(action, result.get('Code', response.status),
+                result.get('Message'))
+        return result
+
+    async def async_list_domain_records(self, domain, page_size=DEFAULT_PAGE_SIZE):
+        """Return every record of a domain, page by page."""
+        records = []
+        page_number = 1
+        while True:
+            result = await self.async_request('DescribeDomainRecords',
+                DomainName=domain, PageNumber=page_number, PageSize=page_size)
+            page = result['DomainRecords']['Record']
+            records.extend(to_domain_record(record) for record in page)
+
+            if not page or len(records) >= result.get('TotalCount', 0):
+                return records
+            page_number += 1
+
+    async def async_add_record(self, domain, rr, record_type, value):
+        """Add a record and return its id."""
+        result = await self.async_request('AddDomainRecord',
+            DomainName=domain, RR=rr, Type=record_type, Value=value)
+        return result['RecordId']
+
+    async def async_update_record(self, record_id, rr, record_type, value):
+        """Change the value of a record."""
+        await self.async_request('UpdateDomainRecord',
+            RecordId=record_id, RR=rr, Type=record_type, Value=value)
@@ -0,0 +1,140 @@
+"""Public ip detection for aliddns."""
+import asyncio
+import ipaddress
+import logging
+from collections import Counter
+from re import compile
+from time import monotonic
+
+import aiohttp
+
+_LOGGER = logging.getLogger(__name__)
+
+_IP_REGEX = compile(r'(?<![\.\d])(?:\d{1,3}\.){3}\d{1,3}(?![\.\d])')
+
+IP_TIMEOUT_DEFAULT = 5  # Default 5s
+IP_QUORUM_DEFAULT = 1
+LATENCY_DECAY = 0.7
+
+
+def find_ipv4(content):
+    """Return the first ipv4 address in the content."""
+    ip_regx = _IP_REGEX.findall(content)
+    if not ip_regx:
+        return None
+    return ip_regx[0]
+
+
+def find_ipv6(content):
+    """Return the content if it is an ipv6 address."""
+    try:
+        ip = ipaddress.ip_address(content.strip())
+    except ValueError:
+        return None
+    if ip.version != 6:
+        return None
+    return str(ip)
+
+
+class IpProvider:
+    """A public ip provider and its statistics."""
+
+    def __init__(self, name, url, parser, encoding='utf-8'):
+        self.name = name
+        self.url = url
+        self._parser = parser
+        self._encoding = encoding
+        self.success = 0
+        self.failure = 0
+        self.latency = None
+
+    @property
+    def stats(self):
+        """Return the success, failure and latency in ms of the provider."""
+        return {
+            'success': self.success,
+            'failure': self.failure,
+            'latency': round(self.latency * 1000) if self.latency is not None else None,
+        }
+
+    def report(self, ip, latency):
+        """Record the outcome of a request."""
+        if not ip:
+            self.failure += 1
+            return
+
+        self.success += 1
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency = self.latency * LATENCY_DECAY + latency * (1 - LATENCY_DECAY)
+
+    async def async_get_ip(self, session, timeout):
+        """Ask the provider, return None when it fails."""
+        start = monotonic()
+        ip = None
+        try:
+            async with session.get(self.url, timeout=timeout) as response:
+                if response.status == 200:
+                    content = (await response.read()).decode(self._encoding)
+                    ip = self._parser(content)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            _LOGGER.debug("get %s failed : %s", self.url, e)
+
+        self.report(ip, monotonic() - start)
+        return ip
+
+
+IPV4_PROVIDERS = [
+    ("3322", "http://members.3322.org/dyndns/getip", find_ipv4, 'utf-8'),
+    ("sohu", "https://pv.sohu.com/cityjson?ie=utf-8", find_ipv4, 'utf-8'),
+    ("netcn", "http://www.net.cn/static/customercare/yourip.asp", find_ipv4, 'gbk'),
+]
+
+IPV6_PROVIDERS = [
+    ("ipify", "https://api6.ipify.org", find_ipv6, 'utf-8'),
+    ("ident", "https://v6.ident.me", find_ipv6, 'utf-8'),
+]
+
+
+class PublicIpDetector:
+    """Ask every provider at once, the first answer given by quorum providers wins."""
+
+    def __init__(self, session, providers, timeout=IP_TIMEOUT_DEFAULT,
+                 quorum=IP_QUORUM_DEFAULT):
+        self._session = session
+        self._providers = [IpProvider(*provider) for provider in providers]
+        self._timeout = aiohttp.ClientTimeout(total=timeout)
+        self._quorum = min(quorum, len(self._providers))
+
+    @property
+    def stats(self):
+        """Return the statistics of every provider."""
+        return {provider.name: provider.stats for provider in self._providers}
+
+    async def async_detect(self):
+        """Return the public ip, or None when no quorum was reached."""
+        tasks = [asyncio.ensure_future(
+            provider.async_get_ip(self._session, self._timeout))
+            for provider in self._providers]
+
+        votes = Counter()
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                ip = await next_done
+                if not ip:
+                    continue
+
+                votes[ip] += 1
+                if votes[ip] >= self._quorum:
+                    return ip
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        if votes:
+            _LOGGER.warning("no quorum of %s on the public ip : %s",
+                self._quorum, dict(votes))
+        return None
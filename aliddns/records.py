@@ -0,0 +1,101 @@
+"""Local state of the aliddns records."""
+import logging
+from collections import namedtuple
+
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util
+
+_LOGGER = logging.getLogger(__name__)
+
+STORAGE_VERSION = 1
+STORAGE_KEY = "aliddns_records"
+
+RECONCILE_INTERVAL_DEFAULT = 3600  # Default 3600s
+
+
+def record_key(domain, rr, record_type):
+    """Return the key of a record in the cache."""
+    return "%s.%s/%s" % (rr, domain, record_type)
+
+
+class DdnsRecord(namedtuple("DdnsRecord", ["domain", "rr", "type"])):
+    """A record kept up to date with the public ip."""
+
+    @property
+    def key(self):
+        """Return the key of the record in the cache."""
+        return record_key(self.domain, self.rr, self.type)
+
+    @property
+    def name(self):
+        """Return the full name of the record."""
+        if self.rr == "@":
+            return self.domain
+        return "%s.%s" % (self.rr, self.domain)
+
+
+class RecordStateCache:
+    """Remember the last value written to each record, across restarts.
+
+    A record only needs to be read back from Aliyun when it was never seen,
+    a write failed, or the reconcile interval passed.
+    """
+
+    def __init__(self, hass, reconcile_interval=RECONCILE_INTERVAL_DEFAULT):
+        """Init the cache, call async_load before using it."""
+        self._store = Store(hass, STORAGE_VERSION, STORAGE_KEY)
+        self._reconcile_interval = reconcile_interval
+        self._records = {}
+        self._loaded = False
+
+    async def async_load(self):
+        """Load the saved records once."""
+        if self._loaded:
+            return
+
+        data = await self._store.async_load()
+        if data:
+            self._records = data.get("records", {})
+        self._loaded = True
+
+    async def async_save(self):
+        """Save the records."""
+        await self._store.async_save({"records": self._records})
+
+    def get(self, key):
+        """Return the state of a record, or None."""
+        return self._records.get(key)
+
+    def need_reconcile(self, key):
+        """Return if the record must be read back from Aliyun."""
+        state = self._records.get(key)
+        if not state or state.get("failed") or not state.get("record_id"):
+            return True
+
+        reconciled = dt_util.parse_datetime(state.get("reconciled") or "")
+        if not reconciled:
+            return True
+
+        return self._reconcile_interval < (
+            dt_util.utcnow() - reconciled).total_seconds()
+
+    def set_reconciled(self, key, record_id, value):
+        """Record the value read from Aliyun."""
+        self._records[key] = {
+            "record_id": record_id,
+            "value": value,
+            "reconciled": dt_util.utcnow().isoformat(),
+            "failed": False,
+        }
+
+    def set_written(self, key, value):
+        """Record a value written to Aliyun."""
+        state = self._records.setdefault(key, {})
+        state["value"] = value
+        state["failed"] = False
+
+    def set_failed(self, key):
+        """Forget the record id, the next update reconciles the record."""
+        state = self._records.setdefault(key, {})
+        state["record_id"] = None
+        state["failed"] = True
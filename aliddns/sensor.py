@@ -1,31 +1,14 @@
 """Asusrouter status sensors."""
+import asyncio
 import logging
-import math
 from datetime import datetime
 from homeassistant.helpers.entity import Entity
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
 from . import AliddnsConfig
 from . import DATA_ALIDDNS
-
-import time
-import hmac
-from os import popen
-from re import search
-from json import loads
-from re import compile
-from sys import stdout
-from hashlib import sha1
-from requests import get
-from requests import post
-from random import randint
-from urllib.request import urlopen
-from urllib.request import Request
-from urllib.parse import urlencode
-from json import JSONDecoder
-from urllib.error import HTTPError
-from datetime import datetime
-from urllib.parse import quote
-from base64 import encodestring
-import requests
+from .aliyun import AliyunDnsClient
+from .ipdetect import PublicIpDetector, IPV4_PROVIDERS, IPV6_PROVIDERS
+from .records import RecordStateCache
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -46,16 +29,19 @@ class AliddnsSensor(Entity):
         self._name = aliddns_conf.name
         self._hass = hass
         self._state = None
-        self.Aliyun_API_URL = "https://alidns.aliyuncs.com/?"
-        self.access_id = aliddns_conf.access_id
-        self.access_key = aliddns_conf.access_key
-        self.domain = aliddns_conf.domain
-        self.sub_domain = aliddns_conf.sub_domain
-        self.Aliyun_API_Type = "A"
+        self._session = async_get_clientsession(hass)
+        self._client = AliyunDnsClient(self._session,
+            aliddns_conf.access_id, aliddns_conf.access_key)
+        self._detector = PublicIpDetector(self._session, IPV4_PROVIDERS,
+            aliddns_conf.ip_timeout, aliddns_conf.ip_quorum)
+        self._detector_v6 = PublicIpDetector(self._session, IPV6_PROVIDERS,
+            aliddns_conf.ip_timeout, aliddns_conf.ip_quorum)
+        self._ddns_records = aliddns_conf.records
         self._record = None
+        self._record_v6 = None
         self._last_record = "0.0.0.0"
         self._update_time = ""
-        self._rc_record_id = -1
+        self._records = RecordStateCache(hass, aliddns_conf.reconcile_interval)
 
     @property
     def name(self):
@@ -70,192 +56,139 @@ class AliddnsSensor(Entity):
     @property  
     def device_state_attributes(self):
         """Return the state attributes."""	
+        records = {}
+        for record in self._ddns_records:
+            state = self._records.get(record.key)
+            records["%s/%s" % (record.name, record.type)] = \
+                state.get("value") if state else None
+
         return {
             'update_time': self._update_time,
             'record': self._record,
-            'domain': "%s.%s" % (self.sub_domain,self.domain),
+            'record_v6': self._record_v6,
+            'domain': self._ddns_records[0].name if self._ddns_records else None,
             'last_record': self._last_record,
+            'records': records,
+            'ip_providers': self._detector.stats,
+            'ipv6_providers': self._detector_v6.stats,
         }
 
-    def AliyunSignature(self,parameters):
-        sortedParameters = sorted(parameters.items(), key=lambda parameters: parameters[0])
-        canonicalizedQueryString = ''
-        for (k, v) in sortedParameters:
-            canonicalizedQueryString += '&' + self.CharacterEncode(k) + '=' + self.CharacterEncode(v)
-        stringToSign = 'GET&%2F&' + self.CharacterEncode(canonicalizedQueryString[1:])
-        h = hmac.new((self.access_key + "&").encode('ASCII'), stringToSign.encode('ASCII'), sha1)
-        signature = encodestring(h.digest()).strip()
-        return signature
-
-    def CharacterEncode(self,encodeStr):
-        encodeStr = str(encodeStr)
-        res = quote(encodeStr.encode('utf-8'), '')
-        res = res.replace('+', '%20')
-        res = res.replace('*', '%2A')
-        res = res.replace('%7E', '~')
-        return res
-
-    def AliyunAPIPOST(self,Aliyun_API_Action):
-        Aliyun_API_SD = {
-            'Format': 'json',
-            'Version': '2015-01-09',
-            'AccessKeyId': self.access_id,
-            'SignatureMethod': 'HMAC-SHA1',
-            'Timestamp': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
-            'SignatureVersion': '1.0',	
-            'SignatureNonce': randint(0, 99999999999999),
-            'Action': Aliyun_API_Action
-        }
-        return Aliyun_API_SD
-
-    def check_record_id(self,sub_domain,domain):
-        Aliyun_API_Post = self.AliyunAPIPOST('DescribeDomainRecords')
-        Aliyun_API_Post['DomainName'] = domain
-        Aliyun_API_Post['Signature'] = self.AliyunSignature(Aliyun_API_Post)
-        Aliyun_API_Post = urlencode(Aliyun_API_Post)
-        Aliyun_API_Request = get(self.Aliyun_API_URL + Aliyun_API_Post)
-
-        domainRecords = ''
-        try:
-            domainRecords = Aliyun_API_Request.text
-        except HTTPError as e:
-            _LOGGER.error(e.code)
-
-        try:
-            result = JSONDecoder().decode(domainRecords)
-            if not result:
-                return -1
-            result = result['DomainRecords']['Record']
-            times = 0
-            check = 0
-            for record_info in result:
-                if record_info['RR'] == sub_domain:
-                    check = 1
-                    break
-                else:
-                    times += 1
-            if check:
-                result = int(result[times]['RecordId'])
+    async def get_ip(self):
+        return await self._detector.async_detect()
+
+    async def get_ipv6(self):
+        return await self._detector_v6.async_detect()
+
+    async def list_domain(self, domain):
+        """Return the records of a domain by rr and type."""
+        index = {}
+        for record in await self._client.async_list_domain_records(domain):
+            index[(record.rr, record.type)] = record
+        return index
+
+    async def add_record(self, record, value):
+        record_id = await self._client.async_add_record(
+            record.domain, record.rr, record.type, value)
+        self._records.set_reconciled(record.key, record_id, value)
+        self._update_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    async def write_record(self, record, value):
+        state = self._records.get(record.key)
+        await self._client.async_update_record(state["record_id"],
+            record.rr, record.type, value)
+        if record.type == "A":
+            self._last_record = state["value"]
+        self._records.set_written(record.key, value)
+        self._update_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    async def run_records(self, records, job):
+        """Run job(record) for every record at once, return the failed ones."""
+        results = await asyncio.gather(*[job(record) for record in records],
+            return_exceptions=True)
+
+        failed = []
+        for record, result in zip(records, results):
+            if isinstance(result, Exception):
+                _LOGGER.error("%s %s : %s", record.name, record.type, result)
+                self._records.set_failed(record.key)
+                failed.append(record)
+        return failed
+
+    async def reconcile_records(self, records, values):
+        """Read the records back with one listing per domain, add the missing ones."""
+        domains = list(set(record.domain for record in records))
+        indexes = {}
+
+        async def _list(domain):
+            indexes[domain] = await self.list_domain(domain)
+
+        failed = []
+        results = await asyncio.gather(*[_list(domain) for domain in domains],
+            return_exceptions=True)
+        for domain, result in zip(domains, results):
+            if isinstance(result, Exception):
+                _LOGGER.error("list %s : %s", domain, result)
+
+        missing = []
+        for record in records:
+            index = indexes.get(record.domain)
+            if index is None:
+                self._records.set_failed(record.key)
+                failed.append(record)
+                continue
+
+            found = index.get((record.rr, record.type))
+            if found:
+                self._records.set_reconciled(record.key, found.record_id, found.value)
             else:
-                result = -1
-            return result
-        except  Exception as e:
-            _LOGGER.error(e)
-            return -1
-
-    def ip_from3322(self):
-        try:
-            ret = requests.get("http://members.3322.org/dyndns/getip")
-        except requests.RequestException as ex:
-            return None
-        if ret.status_code != requests.codes.ok:
-            return None
-        return ret.content.decode('utf-8').rstrip("\n")
-
-    def ip_from_sohu(self):
-        get_ip_method = popen('curl -s https://pv.sohu.com/cityjson?ie=utf-8')
-        if not get_ip_method:
-            return None
-        buffer_lines = get_ip_method.readlines()
-        if not buffer_lines:
-            return None
-        get_ip_responses = buffer_lines[0]	
-        if not get_ip_responses:
-            return None
-        get_ip_pattern = compile(r'(?<![\.\d])(?:\d{1,3}\.){3}\d{1,3}(?![\.\d])')	
-        get_ip_value = get_ip_pattern.findall(get_ip_responses)
-        if not get_ip_value:
-            return None
-        return get_ip_value[0]
-
-    def ip_from_netcn(self):
-        opener = urlopen('http://www.net.cn/static/customercare/yourip.asp')
-        if not opener:
-            return None
-        strg = opener.read().decode('gbk')
-        ipaddr = search('\d+\.\d+\.\d+\.\d+',strg).group(0)
-        return ipaddr
-
-    def get_ip(self):
-        ip = self.ip_from3322()
-        if ip:
-            return ip
-        ip = self.ip_from_sohu()
-        if ip:
-            return ip
-        return self.ip_from_netcn()
-
-    def old_ip(self,Aliyun_API_RecordID):
-        Aliyun_API_Post = self.AliyunAPIPOST('DescribeDomainRecordInfo')
-        Aliyun_API_Post['RecordId'] = Aliyun_API_RecordID
-        Aliyun_API_Post['Signature'] = self.AliyunSignature(Aliyun_API_Post)
-        Aliyun_API_Post = urlencode(Aliyun_API_Post)
-        Aliyun_API_Request = get(self.Aliyun_API_URL + Aliyun_API_Post)
-        result = JSONDecoder().decode(Aliyun_API_Request.text)
-        return result['Value']
-
-    def add_dns(self,domainIP):
-        Aliyun_API_Post = self.AliyunAPIPOST('AddDomainRecord')
-        Aliyun_API_Post['DomainName'] = self.domain
-        Aliyun_API_Post['RR'] = self.sub_domain
-        Aliyun_API_Post['Type'] = self.Aliyun_API_Type
-        Aliyun_API_Post['Value'] = domainIP
-        Aliyun_API_Post['Signature'] = self.AliyunSignature(Aliyun_API_Post)
-        Aliyun_API_Post = urlencode(Aliyun_API_Post)
-        Aliyun_API_Request = get(self.Aliyun_API_URL + Aliyun_API_Post)
-
-    def delete_dns(self,Aliyun_API_RecordID):
-        Aliyun_API_Post = self.AliyunAPIPOST('DeleteDomainRecord')
-        Aliyun_API_Post['RecordId'] = Aliyun_API_RecordID
-        Aliyun_API_Post['Signature'] = self.AliyunSignature(Aliyun_API_Post)
-        Aliyun_API_Post = urlencode(Aliyun_API_Post)
-        Aliyun_API_Request = get(self.Aliyun_API_URL + Aliyun_API_Post)
-
-    def update_dns(self,Aliyun_API_RecordID, Aliyun_API_Value):
-        Aliyun_API_Post = self.AliyunAPIPOST('UpdateDomainRecord')
-        Aliyun_API_Post['RecordId'] = Aliyun_API_RecordID
-        Aliyun_API_Post['RR'] = self.sub_domain
-        Aliyun_API_Post['Type'] = self.Aliyun_API_Type
-        Aliyun_API_Post['Value'] = Aliyun_API_Value
-        Aliyun_API_Post['Signature'] = self.AliyunSignature(Aliyun_API_Post)
-        Aliyun_API_Post = urlencode(Aliyun_API_Post)
-        Aliyun_API_Request = get(self.Aliyun_API_URL + Aliyun_API_Post)
-
-    def set_dns(self,Aliyun_API_RecordID, Aliyun_API_Enabled):
-        Aliyun_API_Post = self.AliyunAPIPOST('SetDomainRecordStatus')
-        Aliyun_API_Post['RecordId'] = Aliyun_API_RecordID
-        Aliyun_API_Post['Status'] = "Enable" if Aliyun_API_Enabled else "Disable"
-        Aliyun_API_Post['Signature'] = self.AliyunSignature(Aliyun_API_Post)
-        Aliyun_API_Post = urlencode(Aliyun_API_Post)
-        Aliyun_API_Request = get(self.Aliyun_API_URL + Aliyun_API_Post)
-
-    def update_ddns(self):
-        rc_value = self.get_ip()
-        if not rc_value:
-            rc_value = "0.0.0.0"
-
-        if self._rc_record_id < 0:
-            self._rc_record_id = self.check_record_id(self.sub_domain, self.domain)
-
-        if self._rc_record_id < 0:
-            self.add_dns(rc_value)
-            self._record = rc_value
-            self._update_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        else:
-            
-            rc_value_old = self.old_ip(self._rc_record_id)
-            self._record = rc_value
-            if rc_value != rc_value_old:
-                self._last_record = rc_value_old
-                self.update_dns(self._rc_record_id, rc_value)
-                self._update_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        self._state = "on"
+                missing.append(record)
+
+        failed += await self.run_records(missing,
+            lambda record: self.add_record(record, values[record.type]))
+        return failed
+
+    async def update_ddns(self):
+        await self._records.async_load()
+
+        record_types = set(record.type for record in self._ddns_records)
+        values = {}
+        if "A" in record_types:
+            values["A"] = self._record = await self.get_ip()
+        if "AAAA" in record_types:
+            values["AAAA"] = self._record_v6 = await self.get_ipv6()
+
+        records = [record for record in self._ddns_records if values.get(record.type)]
+        failed = [record for record in self._ddns_records if not values.get(record.type)]
+        if failed:
+            _LOGGER.warning("public ip not found for %s",
+                ", ".join(record.name for record in failed))
+
+        reconcile = [record for record in records
+            if self._records.need_reconcile(record.key)]
+        if reconcile:
+            failed += await self.reconcile_records(reconcile, values)
+
+        changed = []
+        for record in records:
+            state = self._records.get(record.key)
+            if record in failed or not state:
+                continue
+            if state.get("value") != values[record.type]:
+                changed.append(record)
+
+        if changed:
+            failed += await self.run_records(changed,
+                lambda record: self.write_record(record, values[record.type]))
+
+        if reconcile or changed:
+            await self._records.async_save()
+
+        self._state = "error" if failed else "on"
 
     async def async_update(self):
         """Fetch status from router."""
         try:
-            await self._hass.async_add_executor_job(self.update_ddns)
+            await self.update_ddns()
         except  Exception as e:
             _LOGGER.error(e)
-            self._rc_record_id = -1
             self._state = "error"
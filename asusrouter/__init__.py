@@ -1,24 +1,25 @@
 """Support for ASUSROUTER devices."""
+import asyncio
+import base64
 import logging
 import json
+import zlib
 import voluptuous as vol
 
 from homeassistant.const import (
-    ATTR_NOW,
-
     CONF_NAME,
     CONF_HOST,
     CONF_PASSWORD,
     CONF_USERNAME,
     CONF_PORT,
-
-    EVENT_TIME_CHANGED,
 )
 from homeassistant.helpers import config_validation as cv
 from homeassistant.helpers.discovery import async_load_platform
-from homeassistant.util import dt as dt_util
 from aioasuswrt.asuswrt import AsusWrt
 from datetime import datetime
+from .publicip import PublicIpResolver
+from .registry import RouterRegistry
+from .timer import IntervalTimer
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -28,6 +29,12 @@ CONF_SSH_KEY = "ssh_key"
 CONF_USE_TELNET = "use_telnet"
 CONF_ADD_ATTR = "add_attribute"
 CONF_PUB_MQTT = "pub_mqtt"
+CONF_PUB_PER_ROUTER = "pub_per_router"
+CONF_PUB_COMPRESS = "pub_compress"
+CONF_PUB_MAX_SIZE = "pub_max_size"
+CONF_PUB_INTERVAL = "pub_interval"
+CONF_PUB_ALIGN = "pub_align"
+CONF_PUB_JITTER = "pub_jitter"
 CONF_SR_HOST_ID = "sr_host_id"
 CONF_SR_CACHING_PROXY = "sr_caching_proxy"
 CONF_SR_HOST_PROXY = "sr_host_proxy"
@@ -39,6 +46,8 @@ CONF_PORT_EXTER = "external_port"
 CONF_PORT_INNER = "internal_port"
 CONF_PORT_BASE = "base_port"
 CONF_PROTOCOL = "protocol"
+CONF_MAX_PARALLEL = "max_parallel"
+CONF_SERVICE_TIMEOUT = "service_timeout"
 
 CONF_VPN_SERVER = "vpn_server"
 CONF_VPN_USERNAME = "vpn_username"
@@ -59,8 +68,16 @@ DOMAIN = "asusrouter"
 DOMAIN_MQTT_PUB = "asusrouter_mqtt_pub"
 CONF_ROUTERS = "routers"
 DATA_ASUSWRT = DOMAIN
+DATA_REGISTRY = "asusrouter_registry"
 DEFAULT_SSH_PORT = 22
 DEFAULT_MAX_OFFINLE = 5
+WAN_STATE_CACHE_DEFAULT = 60  # Default 60s
+DEFAULT_MAX_PARALLEL = 10
+DEFAULT_SERVICE_TIMEOUT = 60
+DEFAULT_PUB_MAX_SIZE = 65536
+DEFAULT_PUB_INTERVAL = 60
+
+EVENT_SERVICE_RESULT = "asusrouter_service_result"
 
 CMD_MQTT_TOPIC = "router_monitor/global/commad/on_get_adbconn_target"
 MQTT_VPN_ACCOUNT_TOPIC = "router_monitor/global/commad/on_get_vpn_account"
@@ -81,6 +98,7 @@ SERVICE_ENABLE_WIFI = "enable_wifi"
 SERVICE_MAP_CLIENT = "map_all_clients"
 
 _SET_INITED_FLAG_CMD = "touch /etc/inited ; service restart_firewall"
+_NVRAM_SNAPSHOT_CMD = 'echo "%s=$(nvram get %s)"'
 
 NETWORK_STATE_DOWNLOAD = "download"
 NETWORK_STATE_UPLOAD = "upload"
@@ -112,11 +130,19 @@ CONFIG_SCHEMA = vol.Schema(
                 ),
                 vol.Optional(CONF_ADD_ATTR, default=False): cv.boolean,
                 vol.Optional(CONF_PUB_MQTT, default=""): cv.string,
+                vol.Optional(CONF_PUB_PER_ROUTER, default=False): cv.boolean,
+                vol.Optional(CONF_PUB_COMPRESS, default=False): cv.boolean,
+                vol.Optional(CONF_PUB_MAX_SIZE, default=DEFAULT_PUB_MAX_SIZE): cv.positive_int,
+                vol.Optional(CONF_PUB_INTERVAL, default=DEFAULT_PUB_INTERVAL): cv.positive_int,
+                vol.Optional(CONF_PUB_ALIGN, default=False): cv.boolean,
+                vol.Optional(CONF_PUB_JITTER, default=0): cv.positive_int,
                 vol.Optional(CONF_SR_HOST_ID, default=""): cv.string,
                 vol.Optional(CONF_SR_CACHING_PROXY, default=""): cv.string,
                 vol.Optional(CONF_SR_HOST_PROXY, default=""): cv.string,
                 vol.Optional(CONF_MAX_OFFINE_SETTING, default=""): cv.string,
                 vol.Optional(CONF_INIT_COMMAND, default=""): cv.string,
+                vol.Optional(CONF_MAX_PARALLEL, default=DEFAULT_MAX_PARALLEL): cv.positive_int,
+                vol.Optional(CONF_SERVICE_TIMEOUT, default=DEFAULT_SERVICE_TIMEOUT): cv.positive_int,
             }
         )
     },
@@ -175,17 +201,24 @@ SERVICE_MAP_CLIENTS_SCHEMA = vol.Schema(
 )
 
 class AsusWrtMqttPub:
-    def __init__(self, hass, publish):
+    def __init__(self, hass, publish, per_router=False, compress=False,
+                 max_size=DEFAULT_PUB_MAX_SIZE, interval=DEFAULT_PUB_INTERVAL,
+                 align=False, jitter=0):
         self._hass = hass
         self._state_publish = False
         self._network_publish = False
+        self._per_router = per_router
+        self._compress = compress
+        self._max_size = max_size
         self._mqtt = hass.components.mqtt
-        self._last_pub_time = dt_util.utcnow()
         self._last_pub_states = {}
+        self._last_pub_network = {}
         self._router_state = {}
         self._network_state = {}
 
-        self._hass.bus.async_listen(EVENT_TIME_CHANGED,self._on_time_change)
+        self._pub_timer = IntervalTimer(hass, self._async_publish,
+            interval, align, jitter)
+        self._pub_timer.start()
 
         mqtt = hass.components.mqtt
         if mqtt:
@@ -210,67 +243,126 @@ class AsusWrtMqttPub:
             network_states[NETWORK_STATE_DOWNLOAD] = states.pop(NETWORK_STATE_DOWNLOAD)
             network_states[NETWORK_STATE_UPLOAD] = states.pop(NETWORK_STATE_UPLOAD)
             
-            self._network_state[name] = json.dumps(network_states)
-            self._router_state[name] = json.dumps(states)
+            self._network_state[name] = network_states
+            self._router_state[name] = dict(states)
         except Exception as e:
             self._router_state = {}
             self._network_state = {}
             _LOGGER.error(e)
-    
-    async def _on_time_change(self, event):
-        try:
-            time_now = event.data.get(ATTR_NOW)
-            if not time_now:
-                return
 
-            time_diff = time_now - self._last_pub_time
-            if time_diff.total_seconds() < 60 :
-                return
+    def _get_delta(self, states, last_pub_states):
+        """Return the changed fields of every router, and mark them published."""
+        delta = {}
+        for name, fields in states.items():
+            last_fields = last_pub_states.setdefault(name, {})
+            changed = {}
+            for key, value in fields.items():
+                if key not in last_fields or last_fields[key] != value:
+                    changed[key] = value
+
+            if changed:
+                last_fields.update(changed)
+                delta[name] = changed
+
+        return delta
+
+    def _publish(self, topic, data):
+        payload = json.dumps(data)
+        if self._compress:
+            payload = base64.b64encode(
+                zlib.compress(payload.encode())).decode()
+        self._mqtt.publish(topic, payload)
+
+    def _publish_delta(self, topic, delta):
+        """Publish per router topics, or batches below the size limit."""
+        if self._per_router:
+            for name, fields in delta.items():
+                self._publish("%s/%s" % (topic, name), fields)
+            return
 
+        batch = {}
+        batch_size = 0
+        for name, fields in delta.items():
+            size = len(json.dumps({name: fields}))
+            if batch and batch_size + size > self._max_size:
+                self._publish(topic, batch)
+                batch = {}
+                batch_size = 0
+            if size > self._max_size:
+                _LOGGER.warning("%s states exceed the mqtt size limit", name)
+
+            batch[name] = fields
+            batch_size += size
+
+        if batch:
+            self._publish(topic, batch)
+    
+    async def _async_publish(self, time_now):
+        try:
             if self._state_publish == True:
-                _LOGGER.debug("AsusWrtMqtt : %s" % self._state_publish)
-                mqtt_publish = {}
-                for key,value in self._router_state.items():
-
-                    update_state = False
-                    if key in self._last_pub_states:
-                        if value != self._last_pub_states[key] :
-                            update_state = True  
-                    else :
-                        update_state = True
-
-                    if update_state :
-                        self._last_pub_states[key] = value
-                        mqtt_publish[key] = value
-
-                states =  json.dumps(mqtt_publish)
-                _LOGGER.debug("mqtt publish routers states")
-                _LOGGER.debug(states)
-                    
-                self._mqtt.publish(MQTT_STATES_UPDATE_TOPIC,states)
+                delta = self._get_delta(self._router_state, self._last_pub_states)
+                _LOGGER.debug("mqtt publish %s routers states", len(delta))
+                self._publish_delta(MQTT_STATES_UPDATE_TOPIC, delta)
 
             if self._network_publish == True:
-                
-                _LOGGER.debug("mqtt publish routers network information")      
-                self._mqtt.publish(MQTT_STATES_NETWORK_TOPIC,json.dumps(self._network_state))
+                delta = self._get_delta(self._network_state, self._last_pub_network)
+                _LOGGER.debug("mqtt publish %s routers network information", len(delta))
+                self._publish_delta(MQTT_STATES_NETWORK_TOPIC, delta)
 
             _LOGGER.debug(time_now)
-            self._last_pub_time = time_now
 
         except Exception as e:
             _LOGGER.error(e)
 
-    async def force_update_states(msg):
+    async def force_update_states(self, msg):
         """Handle new MQTT messages."""
         param = json.loads(msg.payload)
         update_list = param['list']
         _LOGGER.debug("mqtt force update device")
-        if not offline_list:
+        if not update_list:
             return
 
         for update_item in update_list:
-            if update_item in self._last_pub_states:
-                del self._last_pub_states[update_item]
+            self._last_pub_states.pop(update_item, None)
+            self._last_pub_network.pop(update_item, None)
+
+
+class RouterServiceExecutor:
+    """Run a service on many routers with bounded concurrency."""
+
+    def __init__(self, hass, max_parallel, timeout):
+        self._hass = hass
+        self._max_parallel = max_parallel
+        self._timeout = timeout
+
+    async def async_run(self, service, devices, job):
+        """Run job(device) on every device and fire one result event."""
+        semaphore = asyncio.Semaphore(self._max_parallel)
+        report = {"service": service, "success": [], "failed": {}}
+
+        async def _run_one(device):
+            async with semaphore:
+                try:
+                    await asyncio.wait_for(job(device), self._timeout)
+                    if device.connect_failed:
+                        report["failed"][device.device_name] = "connect failed"
+                    else:
+                        report["success"].append(device.device_name)
+                except asyncio.TimeoutError:
+                    report["failed"][device.device_name] = "timeout"
+                except Exception as e:
+                    report["failed"][device.device_name] = str(e)
+                    _LOGGER.error(e)
+
+        if devices:
+            await asyncio.gather(*[_run_one(device) for device in devices])
+
+        if report["failed"]:
+            _LOGGER.warning("%s failed on %s of %s routers" % (service,
+                len(report["failed"]), len(devices)))
+
+        self._hass.bus.async_fire(EVENT_SERVICE_RESULT, report)
+        return report
 
 
 class AsusRouter(AsusWrt):
@@ -293,18 +385,24 @@ class AsusRouter(AsusWrt):
         self._vpn_enabled = False
         self._vpn_user = False
         self._vpn_server = False
-        self._public_ip = "0.0.0.0"
+        self._public_ip = None
         self._ssid = ""
         self._last_vpn_restart_time = None
         self._max_offline_setting = None
         self._wifi_enabled = False
         self._hass = None
+        self._registry = None
         self._device_sn = None
         self._device_state = 0
         self._client_ip_list = []
+        self._public_ip_resolver = PublicIpResolver(self.connection)
 
         self._last_cmd = None
 
+        self._wan2_state = None
+        self._wan2_state_timer = None
+        self._wan_cache_time = WAN_STATE_CACHE_DEFAULT
+
         serial_number = self._device_name.split('_', 1)
         if len(serial_number) > 1:
             self._device_sn = serial_number[1]
@@ -398,11 +496,16 @@ class AsusRouter(AsusWrt):
         return self._wifi_enabled
 
     async def set_ssid(self, ssid):
+        if self._registry and ssid != self._ssid:
+            self._registry.update_ssid(self, self._ssid, ssid)
         self._ssid = ssid
 
     async def set_hass(self, hass):
         self._hass = hass
 
+    async def set_registry(self, registry):
+        self._registry = registry
+
     async def set_wifi_enabled(self, enabled):
         self._wifi_enabled = enabled
 
@@ -433,7 +536,19 @@ class AsusRouter(AsusWrt):
     async def set_public_ip(self, public_ip):
         self._public_ip = public_ip
 
+    async def async_update_public_ip(self):
+        """Refresh the public ip once its cache expired."""
+        public_ip = await self._public_ip_resolver.async_get_public_ip()
+        if public_ip:
+            await self.set_public_ip(public_ip)
+
+    def invalidate_public_ip(self):
+        """Resolve the public ip again on the next update."""
+        self._public_ip_resolver.invalidate()
+
     async def set_vpn_user(self, vpn_user):
+        if self._registry and vpn_user != self._vpn_user:
+            self._registry.update_vpn_user(self, self._vpn_user, vpn_user)
         self._vpn_user = vpn_user
 
     async def set_vpn_server(self, vpn_server):
@@ -451,6 +566,15 @@ class AsusRouter(AsusWrt):
     async def set_device_state(self, state):
         self._device_state = state
 
+    async def set_wan2_state(self, state):
+        self._wan2_state = state
+        self._wan2_state_timer = datetime.utcnow()
+
+    def invalidate_wan_state(self):
+        """Drop the cached dual wan topology."""
+        self._wan2_state = None
+        self._wan2_state_timer = None
+
     async def pub_device_state(self, name, state):
         self._hass.data[DOMAIN_MQTT_PUB].update_router_state(name,state)
 
@@ -520,6 +644,10 @@ class AsusRouter(AsusWrt):
             self._connect_failed = True
             _LOGGER.error(e)
 
+        if "restart_wan" in command_line:
+            self.invalidate_wan_state()
+            self.invalidate_public_ip()
+
     def only_reboot_vpn(self):
         """Return if only reboot vpn service."""
         if self._vpn_enabled:
@@ -552,6 +680,7 @@ class AsusRouter(AsusWrt):
             await self.run_cmdline("service restart_vpncall")
         else:
             await self.run_cmdline("reboot")
+        self.invalidate_public_ip()
 
     async def disable_auto_dns(self):
 
@@ -760,21 +889,55 @@ class AsusRouter(AsusWrt):
         except  Exception as e:
             _LOGGER.error(e)
 
-    async def get_wan2_state(self):
+    async def async_nvram_snapshot(self, keys):
+        """Fetch a group of nvram values in one command."""
+        snapshot = {}
+        if not keys:
+            return snapshot
+
+        lines = await self.connection.async_run_command(
+            " ; ".join(_NVRAM_SNAPSHOT_CMD % (key, key) for key in keys))
+        if not lines:
+            return snapshot
+
+        for line in lines:
+            key, sep, value = line.partition('=')
+            if sep and key in keys:
+                snapshot[key] = value
+
+        return snapshot
+
+    def wan2_state_from_dualwan(self, dualwan):
+        """Return 1 if the wans_dualwan value has a second wan in use."""
+        if not dualwan:
+            return 0
+
+        wan_list = dualwan.split(' ')
+        if len(wan_list) < 2:
+            return 0
+
+        if wan_list[1] != "none":
+            return 1
+
+        return 0
+
+    async def get_wan2_state(self, use_cache=True):
         """Get router wan2 status."""
+        now = datetime.utcnow()
+        if (
+            use_cache
+            and self._wan2_state_timer
+            and self._wan_cache_time > (now - self._wan2_state_timer).total_seconds()
+        ):
+            return self._wan2_state
+
         try:
             status = await self.connection.async_run_command("nvram get wans_dualwan")
             if not status:
                 return 0
 
-            wan_list = status[0].split(' ')
-            if len(wan_list) < 2:
-                return 0
-
-            if wan_list[1] != "none":
-                return 1
-
-            return 0
+            await self.set_wan2_state(self.wan2_state_from_dualwan(status[0]))
+            return self._wan2_state
 
         except  Exception as e:
             _LOGGER.error(e)
@@ -811,8 +974,19 @@ async def async_setup(hass, config):
 
         routers.append(router)
 
+    registry = RouterRegistry(routers)
+    for router in routers:
+        await router.set_registry(registry)
+
     hass.data[DATA_ASUSWRT] = routers
-    hass.data[DOMAIN_MQTT_PUB] = AsusWrtMqttPub(hass,config[DOMAIN][CONF_PUB_MQTT])
+    hass.data[DATA_REGISTRY] = registry
+    hass.data[DOMAIN_MQTT_PUB] = AsusWrtMqttPub(hass,config[DOMAIN][CONF_PUB_MQTT],
+        config[DOMAIN][CONF_PUB_PER_ROUTER], config[DOMAIN][CONF_PUB_COMPRESS],
+        config[DOMAIN][CONF_PUB_MAX_SIZE], config[DOMAIN][CONF_PUB_INTERVAL],
+        config[DOMAIN][CONF_PUB_ALIGN], config[DOMAIN][CONF_PUB_JITTER])
+
+    executor = RouterServiceExecutor(hass,
+        config[DOMAIN][CONF_MAX_PARALLEL], config[DOMAIN][CONF_SERVICE_TIMEOUT])
 
     hass.async_create_task(
         async_load_platform(hass, "sensor", DOMAIN, {}, config)
@@ -824,10 +998,9 @@ async def async_setup(hass, config):
     
     async def _reboot(call):
         """Restart a router."""
-        devices = hass.data[DOMAIN]
-        for device in devices:
-            if device.host == call.data[CONF_HOST]:
-                await device.reboot()
+        await executor.async_run(SERVICE_REBOOT,
+            registry.find_by_host(call.data[CONF_HOST], allow_all=False),
+            lambda device: device.reboot())
             
     hass.services.async_register(
         DOMAIN, SERVICE_REBOOT, _reboot, schema=SERVICE_REBOOT_SCHEMA
@@ -835,10 +1008,9 @@ async def async_setup(hass, config):
 
     async def _run_command(call):
         """Restart a router."""
-        devices = hass.data[DOMAIN]
-        for device in devices:
-            if device.host == call.data[CONF_HOST] or call.data[CONF_HOST] == "ALL":
-                await device.run_command(call.data[CONF_COMMAND_LINE])
+        await executor.async_run(SERVICE_RUNCOMMAND,
+            registry.find_by_host(call.data[CONF_HOST]),
+            lambda device: device.run_command(call.data[CONF_COMMAND_LINE]))
 
     hass.services.async_register(
         DOMAIN, SERVICE_RUNCOMMAND, _run_command, schema=SERVICE_RUN_COMMAND_SCHEMA
@@ -846,10 +1018,9 @@ async def async_setup(hass, config):
 
     async def _init_device(call):
         """Restart a router."""
-        devices = hass.data[DOMAIN]
-        for device in devices:
-            if device.host == call.data[CONF_HOST] or call.data[CONF_HOST] == "ALL":
-                await device.init_device(call.data[CONF_COMMAND_LINE])
+        await executor.async_run(SERVICE_INITDEVICE,
+            registry.find_by_host(call.data[CONF_HOST]),
+            lambda device: device.init_device(call.data[CONF_COMMAND_LINE]))
 
     hass.services.async_register(
         DOMAIN, SERVICE_INITDEVICE, _init_device, schema=SERVICE_INIT_DEVICE_SCHEMA
@@ -857,15 +1028,13 @@ async def async_setup(hass, config):
 
     async def _set_port_forward(call):
         """Restart a router."""
-        devices = hass.data[DOMAIN]
-        for device in devices:
-            if device.ssid == call.data[CONF_SSID]:
-                await device.set_port_forward(
-                    call.data[CONF_PORT_EXTER],
-                    call.data[CONF_PORT_INNER],
-                    call.data[CONF_PROTOCOL],
-                    call.data[CONF_TARGETHOST]
-                )
+        for device in registry.find_by_ssid(call.data[CONF_SSID]):
+            await device.set_port_forward(
+                call.data[CONF_PORT_EXTER],
+                call.data[CONF_PORT_INNER],
+                call.data[CONF_PROTOCOL],
+                call.data[CONF_TARGETHOST]
+            )
 
     hass.services.async_register(
         DOMAIN, SERVICE_SET_PORT_FORWARD, _set_port_forward, schema=SERVICE_SET_PORTFORWARD_SCHEMA
@@ -873,15 +1042,13 @@ async def async_setup(hass, config):
 
     async def _set_vpn_connect(call):
         """Restart a router."""
-        devices = hass.data[DOMAIN]
-        for device in devices:
-            if device.ssid == call.data[CONF_SSID]:
-                await device.set_vpn_connect(
-                    call.data[CONF_VPN_SERVER],
-                    call.data[CONF_VPN_USERNAME],
-                    call.data[CONF_VPN_PASSWORD],
-                    call.data[CONF_VPN_PROTOCOL]
-                )
+        for device in registry.find_by_ssid(call.data[CONF_SSID]):
+            await device.set_vpn_connect(
+                call.data[CONF_VPN_SERVER],
+                call.data[CONF_VPN_USERNAME],
+                call.data[CONF_VPN_PASSWORD],
+                call.data[CONF_VPN_PROTOCOL]
+            )
 
     hass.services.async_register(
         DOMAIN, SERVICE_SET_VPN_CONNECT, _set_vpn_connect, schema=SERVICE_SET_VPN_CONNECT_SCHEMA
@@ -889,10 +1056,9 @@ async def async_setup(hass, config):
 
     async def _enable_wifi(call):
         """enable a router wifi."""
-        devices = hass.data[DOMAIN]
-        for device in devices:
-            if device.host == call.data[CONF_HOST] or call.data[CONF_HOST] == "ALL":
-                await device.enable_wifi(call.data[CONF_TYPE_WIFI],call.data[CONF_ENABLE_WIFI])
+        await executor.async_run(SERVICE_ENABLE_WIFI,
+            registry.find_by_host(call.data[CONF_HOST]),
+            lambda device: device.enable_wifi(call.data[CONF_TYPE_WIFI],call.data[CONF_ENABLE_WIFI]))
 
     hass.services.async_register(
         DOMAIN, SERVICE_ENABLE_WIFI, _enable_wifi, schema=SERVICE_ENABLE_WIFI_SCHEMA
@@ -900,11 +1066,10 @@ async def async_setup(hass, config):
 
     async def _map_client(call):
         """map all clients in a router."""
-        devices = hass.data[DOMAIN]
-        for device in devices:
-            if device.host == call.data[CONF_HOST] or call.data[CONF_HOST] == "ALL":
-                await device.map_clients(call.data[CONF_PORT_BASE],
-                call.data[CONF_PORT_INNER], call.data[CONF_PROTOCOL])
+        await executor.async_run(SERVICE_MAP_CLIENT,
+            registry.find_by_host(call.data[CONF_HOST]),
+            lambda device: device.map_clients(call.data[CONF_PORT_BASE],
+                call.data[CONF_PORT_INNER], call.data[CONF_PROTOCOL]))
 
     hass.services.async_register(
         DOMAIN, SERVICE_MAP_CLIENT, _map_client, schema=SERVICE_MAP_CLIENTS_SCHEMA
@@ -913,56 +1078,51 @@ async def async_setup(hass, config):
     async def _get_adbconn_target(msg):
         """Handle new MQTT messages."""
         param = json.loads(msg.payload)
-        devices = hass.data[DOMAIN]
         _LOGGER.debug("mqtt get adb connect information")
         _LOGGER.debug(param)
-        for device in devices:
-            if device.ssid == param['ssid']:
-                try:
+        for device in registry.find_by_ssid(param['ssid']):
+            try:
 
-                    await device.disable_auto_dns()
-                    await device.set_port_forward(
-                        5555,5555,'TCP',param['target']
-                    )
-                    num_list = device.host.split('.')
-                    mqtt = hass.components.mqtt
-                    msg = "{\"host\": \"%s\", \"domain\": \"%s\", \"public_ip\": \"%s\", \"port\": %s, \"wan2_in_use\": %s}" % (device.host, 
-                        hass.states.get(device.sr_host_id).attributes.get('domain'), 
-                        hass.states.get(device.sr_host_id).attributes.get('record'), 5000+int(num_list[3]), await device.get_wan2_state())
-                    req_id = param.get('requestid')
-                    if req_id:
-                        mqtt.publish("%s/%s" % (CMD_MQTT_TOPIC,req_id), msg)
-                    else:
-                        mqtt.publish(CMD_MQTT_TOPIC, msg)
+                await device.disable_auto_dns()
+                await device.set_port_forward(
+                    5555,5555,'TCP',param['target']
+                )
+                num_list = device.host.split('.')
+                mqtt = hass.components.mqtt
+                msg = "{\"host\": \"%s\", \"domain\": \"%s\", \"public_ip\": \"%s\", \"port\": %s, \"wan2_in_use\": %s}" % (device.host, 
+                    hass.states.get(device.sr_host_id).attributes.get('domain'), 
+                    hass.states.get(device.sr_host_id).attributes.get('record'), 5000+int(num_list[3]), await device.get_wan2_state(use_cache=False))
+                req_id = param.get('requestid')
+                if req_id:
+                    mqtt.publish("%s/%s" % (CMD_MQTT_TOPIC,req_id), msg)
+                else:
+                    mqtt.publish(CMD_MQTT_TOPIC, msg)
 
-                except  Exception as e:
-                    _LOGGER.error(e)
+            except  Exception as e:
+                _LOGGER.error(e)
 
     async def _get_vpn_account(msg):
         """Handle new MQTT messages."""
         param = json.loads(msg.payload)
-        devices = hass.data[DOMAIN]
         _LOGGER.debug("mqtt get vpn settings")
         _LOGGER.debug(param)
-        for device in devices:
-            if device.vpn_user == param['vpn_user']:
-                try:
-                    mqtt = hass.components.mqtt
-                    msg = "{\"user\": \"%s\",\"state\": \"%s\", \"deviceid\": \"%s\", \"server\": \"%s\", \"connect_state\": \"%s\"}" % (device.vpn_user, 
-                        "inuse" if device.vpn_enabled else "nouse",device.device_name,device.vpn_server,device.device_state)
-                    req_id = param.get('requestid')
-                    if req_id:
-                        mqtt.publish("%s/%s" % (MQTT_VPN_ACCOUNT_TOPIC,req_id), msg)
-                    else:
-                        mqtt.publish(MQTT_VPN_ACCOUNT_TOPIC, msg)
+        for device in registry.find_by_vpn_user(param['vpn_user']):
+            try:
+                mqtt = hass.components.mqtt
+                msg = "{\"user\": \"%s\",\"state\": \"%s\", \"deviceid\": \"%s\", \"server\": \"%s\", \"connect_state\": \"%s\"}" % (device.vpn_user, 
+                    "inuse" if device.vpn_enabled else "nouse",device.device_name,device.vpn_server,device.device_state)
+                req_id = param.get('requestid')
+                if req_id:
+                    mqtt.publish("%s/%s" % (MQTT_VPN_ACCOUNT_TOPIC,req_id), msg)
+                else:
+                    mqtt.publish(MQTT_VPN_ACCOUNT_TOPIC, msg)
 
-                except  Exception as e:
-                    _LOGGER.error(e)
+            except  Exception as e:
+                _LOGGER.error(e)
 
     async def _device_offline(msg):
         """Handle new MQTT messages."""
         param = json.loads(msg.payload)
-        devices = hass.data[DOMAIN]
         offline_list = param['offline_list']
         _LOGGER.debug("mqtt try to resume devices")
         _LOGGER.debug(param)
@@ -972,19 +1132,16 @@ async def async_setup(hass, config):
         for offline_item in offline_list:
             try:
 
-                for device in devices:
+                for device in registry.find_by_device_id(offline_item['id']):
 
                     if offline_item['online'] > device.get_max_offine(hass):
                         continue
 
-                    if not device.match_device_id(offline_item['id']):
-                        continue
-
                     if not device.wifi_enabled:
                         _LOGGER.warning("router %s is not enabled" % (device.device_name))
                         continue
 
-                    if device.public_ip == "":
+                    if not device.public_ip:
                         continue
                     if device.public_ip == "0.0.0.0":
                         continue
@@ -998,16 +1155,12 @@ async def async_setup(hass, config):
     async def _change_vpn_user(msg):
         """Handle new MQTT messages."""
         param = json.loads(msg.payload)
-        devices = hass.data[DOMAIN]
         _LOGGER.debug("mqtt change vpn connect setting")
         _LOGGER.debug(param)
         try:
-            for device in devices:
+            for device in registry.find_by_device_id(param['id']):
 
-                if not device.match_device_id(param['id']):
-                        continue
-
-                if await device.get_wan2_state() == 1:
+                if await device.get_wan2_state(use_cache=False) == 1:
                     _LOGGER.warning("mqtt change router's (%s)  vpn server error. can not change with more wans" % device.device_name)
                     continue
 
@@ -1031,7 +1184,6 @@ async def async_setup(hass, config):
 
     async def _mqtt_map_client(msg):
         param = json.loads(msg.payload)
-        devices = hass.data[DOMAIN]
         _LOGGER.debug("mqtt map all client on device")
         _LOGGER.debug(param)
 
@@ -1061,11 +1213,8 @@ async def async_setup(hass, config):
             protocol = "TCP"
 
         try:
-            for device in devices:
+            for device in registry.find_by_device_id(param['id']):
 
-                if not device.match_device_id(param['id']):
-                        continue
-                
                 map_list = await device.map_clients(base_port,
                     inner_port, protocol)
 
@@ -0,0 +1,397 @@
+"""Shared poll coordinator for asusrouter sensors."""
+import asyncio
+import logging
+from datetime import datetime
+from re import compile
+
+_LOGGER = logging.getLogger(__name__)
+
+_NVRAM_KEYS = [
+    'wans_dualwan',
+    'vpnc_proto',
+    'vpnc_state_t',
+    'vpnc_pppoe_username',
+    'vpnc_heartbeat_x',
+    'wl1_ssid',
+    'wl1_radio',
+    'wl0_radio',
+]
+_NVRAM_WAN_KEYS = [
+    '%s_ipaddr',
+    '%s_state_t',
+    '%s_proto',
+    '%s_pppoe_username',
+    '%s_heartbeat_x',
+]
+_NVRAM_SNAPSHOT_KEYS = _NVRAM_KEYS + [
+    key % wan for wan in ("wan0", "wan1") for key in _NVRAM_WAN_KEYS]
+
+_WIFI_CHANNEL_5G_CMD = 'wl -i eth2 status ; iwlist ath1 channel'
+_WIFI_CHANNEL_2G_CMD = 'wl -i eth1 status ; wlanconfig ath0 list'
+
+_ROUTER_IS_INITED_COMMAND = 'find /etc/inited'
+_RET_IS_INITED = '/etc/inited'
+
+_DHCP_CLIENTS_COMMAND = 'cat /var/lib/misc/dnsmasq.leases'
+_ARP_LIST_COMMAND = 'arp -n'
+
+CONF_VPN_PROTO_DEFAULE = 'disable'
+
+REFRESH_INTERVAL_DEFAULT = 10  # Default 10s
+
+_IP_REGEX = compile(r'((?<![\.\d])(?:\d{1,3}\.){3}\d{1,3}(?![\.\d]))')
+
+
+class AsusRouterCoordinator:
+    """Run one status sweep per router and share it with every sensor."""
+
+    def __init__(self, name, asusrouter, refresh_interval=REFRESH_INTERVAL_DEFAULT):
+        """Initialize the coordinator."""
+        self._name = name
+        self._asusrouter = asusrouter
+        self._refresh_interval = refresh_interval
+        self._lock = asyncio.Lock()
+        self._last_refresh = None
+
+        self._connected = False
+        self._initialized = False
+        self._wan_ip = "0.0.0.0"
+        self._rates = None
+        self._ppoe_username = ""
+        self._ppoe_heartbeat = ""
+        self._ppoe_proto = CONF_VPN_PROTO_DEFAULE
+        self._5g_wifi = 0
+        self._2g_wifi = 0
+        self._5g_wl_channel = "0"
+        self._2g_wl_channel = "0"
+        self._nvram = {}
+        self._wan_index = "wan0"
+
+    @property
+    def asusrouter(self):
+        """Return the router of the coordinator."""
+        return self._asusrouter
+
+    @property
+    def connected(self):
+        """Return if the last sweep reached the router."""
+        return self._connected
+
+    @property
+    def initialized(self):
+        """Return if the router is initialized."""
+        return self._initialized
+
+    @property
+    def wan_ip(self):
+        """Return the wan ip of router."""
+        return self._wan_ip
+
+    @property
+    def ppoe_username(self):
+        """Return the vpn user name."""
+        return self._ppoe_username
+
+    @property
+    def ppoe_heartbeat(self):
+        """Return the vpn server."""
+        return self._ppoe_heartbeat
+
+    @property
+    def ppoe_proto(self):
+        """Return the vpn protocol."""
+        return self._ppoe_proto
+
+    @property
+    def download(self):
+        """Return the total download."""
+        try:
+            if self._rates[0]:
+                return round(self._rates[0]/1000000000, 2)
+        except  Exception as e:
+            return 0
+
+    @property
+    def upload(self):
+        """Return the total upload."""
+        try:
+            if self._rates[1]:
+                return round(self._rates[1]/1000000000, 2)
+        except  Exception as e:
+            return 0
+
+    @property
+    def attributes(self):
+        """Return the state attributes of the router."""
+        return {
+            'initialized': self._initialized,
+            'wan_ip': self._wan_ip,
+            'public_ip': self._asusrouter.public_ip,
+            'interface': self._asusrouter.interface,
+            'download': self.download,
+            'upload': self.upload,
+            'download_speed': self._asusrouter.download_speed,
+            'upload_speed': self._asusrouter.upload_speed,
+            'connect_state': self._connected,
+            'ssid': self._asusrouter.ssid,
+            'host': self._asusrouter.host,
+            'client_number': self._asusrouter.client_number,
+            '2.4G_wifi': self._2g_wifi,
+            '2.4G_wifi_channel': self._2g_wl_channel,
+            '5G_wifi': self._5g_wifi,
+            '5G_wifi_channel': self._5g_wl_channel,
+            'vpn_username': self._ppoe_username,
+            'vpn_server': self._ppoe_heartbeat,
+            'vpn_proto': self._ppoe_proto,
+        }
+
+    async def async_refresh(self):
+        """Sweep the router unless another sensor did it recently."""
+        async with self._lock:
+            now = datetime.utcnow()
+            if (
+                self._last_refresh
+                and self._refresh_interval > (now - self._last_refresh).total_seconds()
+            ):
+                return
+
+            await self.async_update()
+            self._last_refresh = datetime.utcnow()
+
+    def get_channel_from_line(self, lines):
+        if not lines:
+            return "0"
+
+        line_size = len(lines)
+        if line_size < 4:
+            return "0"
+
+        if lines[0].find("SSID:") >= 0:
+            lines = lines[1].split("	")
+            for line in lines:
+                params = line.split(':')
+                if len(params) > 1 and params[0] == "Channel":
+                    return params[1].strip()
+        else:
+            for line in lines:
+                if line.find("Current Frequency") > 0:
+                    freq_regx = compile(r'(?<=\(Channel )(.+?)(?=\))').findall(line)
+                    if freq_regx:
+                        return freq_regx[0]
+
+        return "0"
+
+    def get_wan_index(self):
+        if self._wan_index == "wan0":
+            return "0"
+
+        return "1"
+
+    def get_wan_value(self, key):
+        """Return a wan nvram value of the wan in use from the snapshot."""
+        return self._nvram.get(key % self._wan_index)
+
+    async def async_get_nvram(self):
+        """Fetch every nvram value used by the sweep in one command."""
+        self._nvram = await self._asusrouter.async_nvram_snapshot(_NVRAM_SNAPSHOT_KEYS)
+        if 'wans_dualwan' in self._nvram:
+            await self._asusrouter.set_wan2_state(
+                self._asusrouter.wan2_state_from_dualwan(self._nvram['wans_dualwan']))
+
+        if await self._asusrouter.get_wan2_state() == 0:
+            self._wan_index = "wan0"
+        else:
+            self._wan_index = "wan1"
+
+    async def async_get_vpn_state(self):
+
+        vpn_proto = self._nvram.get('vpnc_proto')
+        if vpn_proto is not None:
+            self._ppoe_proto = vpn_proto
+
+        if self._ppoe_proto == CONF_VPN_PROTO_DEFAULE:
+            await self._asusrouter.set_vpn_enabled(False)
+        else:
+            await self._asusrouter.set_vpn_enabled(True)
+
+
+    async def async_get_wan_state(self):
+
+        connect = self.get_wan_value('%s_state_t')
+        if connect is None:
+            return
+
+        await self._asusrouter.set_device_state(connect)
+        if connect != '2':
+            return
+
+        if self._asusrouter.vpn_enabled:
+            vpn_state = self._nvram.get('vpnc_state_t')
+            if vpn_state is not None:
+                await self._asusrouter.set_device_state(vpn_state)
+
+    async def async_get_vpn_client(self):
+        if self._asusrouter.vpn_enabled:
+            usrname = self._nvram.get('vpnc_pppoe_username')
+            if usrname is not None:
+                self._ppoe_username = usrname
+            heartbeat = self._nvram.get('vpnc_heartbeat_x')
+            if heartbeat is not None:
+                self._ppoe_heartbeat = heartbeat
+
+    async def async_get_ppoe_vpn(self):
+        usrname = self.get_wan_value('%s_pppoe_username')
+        if usrname is not None:
+            self._ppoe_username = usrname
+        heartbeat = self.get_wan_value('%s_heartbeat_x')
+        if heartbeat is not None:
+            self._ppoe_heartbeat = heartbeat
+
+    async def async_get_public_ip(self):
+        """Get current public ip."""
+        try:
+            await self._asusrouter.async_update_public_ip()
+        except  Exception as e:
+            _LOGGER.error(e)
+            await self._asusrouter.set_public_ip("0.0.0.0")
+
+    async def pub_data_mqtt(self):
+        """Get trace router attribute to mqtt."""
+        try:
+            data_dict = self.attributes
+            if self._asusrouter.device_state.isdigit():
+                data_dict.update(state=int(self._asusrouter.device_state))
+            await self._asusrouter.pub_device_state(self._name, data_dict)
+        except  Exception as e:
+            _LOGGER.error(e)
+
+    async def get_dhcp_clients(self):
+        """Get dhcp clients."""
+        try:
+            connected_devices = await self._asusrouter.connection.async_run_command(
+                _DHCP_CLIENTS_COMMAND)
+            if  not connected_devices:
+                await self._asusrouter.set_client_number(0)
+                return
+
+            dict_arp = dict()
+            arp_list = await self._asusrouter.connection.async_run_command(
+                _ARP_LIST_COMMAND)
+            for arp in arp_list:
+                arp_info = arp.split(' ')
+                if len(arp_info) < 5:
+                    continue
+                dict_arp[arp_info[1].strip("()")] = arp_info[3]
+
+            client_ip_list = []
+            for device in connected_devices:
+                dhcp_data = device.split(' ')
+                ip_regx = _IP_REGEX.findall(device)
+                if not ip_regx:
+                    continue
+
+                if ip_regx[0] in dict_arp:
+                    client_ip_list.append(ip_regx[0])
+
+            await self._asusrouter.set_client_ip_list(client_ip_list)
+            await self._asusrouter.set_client_number(len(client_ip_list))
+        except  Exception as e:
+            _LOGGER.error(e)
+
+    async def async_update(self):
+        """Fetch status from router."""
+        if self._asusrouter.connect_failed:
+            self._connected = False
+
+        try:
+
+            if not self._connected:
+                await self._asusrouter.connection.async_connect()
+
+            inited = await self._asusrouter.connection.async_run_command(
+                _ROUTER_IS_INITED_COMMAND)
+            if not inited:
+                return
+
+            if inited[0] == _RET_IS_INITED:
+                self._initialized = True
+            else:
+                self._initialized = False
+
+            await self.async_get_nvram()
+            await self.async_get_vpn_state()
+            wan_ip = self.get_wan_value('%s_ipaddr')
+            if wan_ip is not None:
+                self._wan_ip = wan_ip
+
+            await self.async_get_wan_state()
+            await self.async_get_vpn_client()
+            await self._asusrouter.update_static_routing()
+
+            if not self._initialized:
+                await self._asusrouter.init_router()
+
+            ssid = self._nvram.get('wl1_ssid')
+            if ssid is not None:
+                await self._asusrouter.set_ssid(ssid)
+
+            wan_proto = self.get_wan_value('%s_proto')
+            if wan_proto is not None:
+                if wan_proto == 'dhcp' or wan_proto == 'static':
+                    self._asusrouter.interface = "eth%s" % (self.get_wan_index())
+                else:
+                    self._asusrouter.interface = "ppp%s" % (self.get_wan_index())
+                    await self.async_get_ppoe_vpn()
+
+                self._rates = await self._asusrouter.async_get_bytes_total()
+                speed = await self._asusrouter.async_get_current_transfer_rates()
+
+                try:
+                    if speed[0]:
+                        await self._asusrouter.set_download_speed(round(speed[0]/1000, 2))
+                except  Exception as e:
+                        await self._asusrouter.set_download_speed(0.00)
+
+                try:
+                    if speed[1]:
+                        await self._asusrouter.set_upload_speed(round(speed[1]/1000, 2))
+                except  Exception as e:
+                        await self._asusrouter.set_upload_speed(0.00)
+
+
+            wifi_states_5g = self._nvram.get('wl1_radio')
+            if wifi_states_5g and wifi_states_5g.isdigit():
+                self._5g_wifi = int(wifi_states_5g)
+
+            wifi_states_2g = self._nvram.get('wl0_radio')
+            if wifi_states_2g and wifi_states_2g.isdigit():
+                self._2g_wifi = int(wifi_states_2g)
+
+            self._5g_wl_channel = self.get_channel_from_line(await self._asusrouter.connection.async_run_command(
+                _WIFI_CHANNEL_5G_CMD))
+
+            self._2g_wl_channel = self.get_channel_from_line(await self._asusrouter.connection.async_run_command(
+                _WIFI_CHANNEL_2G_CMD))
+
+            if self._5g_wifi==1 or self._2g_wifi==1:
+                await self._asusrouter.set_wifi_enabled(True)
+            else:
+                await self._asusrouter.set_wifi_enabled(False)
+
+            await self.get_dhcp_clients()
+
+            self._connected = True
+            await self.async_get_public_ip()
+
+            await self.pub_data_mqtt()
+
+            await self._asusrouter.set_vpn_user(self._ppoe_username)
+            await self._asusrouter.set_vpn_server(self._ppoe_heartbeat)
+
+        except  Exception as e:
+            self._connected = False
+            await self._asusrouter.set_public_ip("0.0.0.0")
+            self._asusrouter.invalidate_public_ip()
+            if self._asusrouter.connect_failed:
+                await self._asusrouter.set_device_state('0')
+            _LOGGER.error(e)
@@ -0,0 +1,82 @@
+"""Router registry for asusrouter."""
+import logging
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class RouterRegistry:
+    """Index routers by host, ssid, serial number and vpn user."""
+
+    def __init__(self, routers):
+        """Build the indexes."""
+        self._routers = list(routers)
+        self._by_host = {}
+        self._by_name = {}
+        self._by_sn = {}
+        self._by_ssid = {}
+        self._by_vpn_user = {}
+
+        for router in self._routers:
+            self._add(self._by_host, router.host, router)
+            self._add(self._by_name, router.device_name, router)
+            self._add(self._by_sn, router.device_sn, router)
+            self._add(self._by_ssid, router.ssid, router)
+            self._add(self._by_vpn_user, router.vpn_user, router)
+
+    @property
+    def routers(self):
+        """Return all routers."""
+        return self._routers
+
+    def _add(self, index, key, router):
+        index.setdefault(key, []).append(router)
+
+    def _remove(self, index, key, router):
+        routers = index.get(key)
+        if not routers:
+            return
+
+        if router in routers:
+            routers.remove(router)
+        if not routers:
+            del index[key]
+
+    def update_ssid(self, router, old_ssid, new_ssid):
+        """Move a router to its new ssid."""
+        self._remove(self._by_ssid, old_ssid, router)
+        self._add(self._by_ssid, new_ssid, router)
+
+    def update_vpn_user(self, router, old_user, new_user):
+        """Move a router to its new vpn user."""
+        self._remove(self._by_vpn_user, old_user, router)
+        self._add(self._by_vpn_user, new_user, router)
+
+    def find_by_host(self, host, allow_all=True):
+        """Return the routers with the host, or all routers for ALL."""
+        if allow_all and host == "ALL":
+            return list(self._routers)
+        return list(self._by_host.get(host, []))
+
+    def find_by_ssid(self, ssid):
+        """Return the routers with the ssid."""
+        return list(self._by_ssid.get(ssid, []))
+
+    def find_by_vpn_user(self, vpn_user):
+        """Return the routers with the vpn user."""
+        return list(self._by_vpn_user.get(vpn_user, []))
+
+    def find_by_device_id(self, device_id):
+        """Return the routers matching the device id, see match_device_id."""
+        device_id = device_id.strip()
+
+        if not device_id:
+            return []
+
+        routers = list(self._by_name.get(device_id, []))
+
+        if device_id[0].isdigit():
+            for router in self._by_sn.get(device_id[0:3], []):
+                if router not in routers:
+                    routers.append(router)
+
+        return routers
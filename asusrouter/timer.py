@@ -0,0 +1,65 @@
+"""Interval timer for asusrouter."""
+import logging
+import random
+from datetime import timedelta
+
+from homeassistant.helpers.event import async_track_point_in_utc_time
+from homeassistant.util import dt as dt_util
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class IntervalTimer:
+    """Call an action every interval seconds.
+
+    With align the calls land on multiples of the interval, jitter shifts
+    them by a random offset picked once so a fleet does not fire together.
+    """
+
+    def __init__(self, hass, action, interval, align=False, jitter=0):
+        """Init the timer, call start to schedule it."""
+        self._hass = hass
+        self._action = action
+        self._interval = interval
+        self._align = align
+        self._offset = random.uniform(0, min(jitter, interval)) if jitter > 0 else 0
+        self._remove = None
+
+    @property
+    def interval(self):
+        """Return the interval in seconds."""
+        return self._interval
+
+    def next_time(self, now):
+        """Return the next time to call the action after now."""
+        if not self._align:
+            return now + timedelta(seconds=self._interval)
+
+        stamp = now.timestamp() - self._offset
+        return dt_util.utc_from_timestamp(
+            (stamp // self._interval + 1) * self._interval + self._offset)
+
+    def start(self):
+        """Schedule the first call."""
+        now = dt_util.utcnow()
+        if self._align:
+            self._schedule(self.next_time(now))
+        else:
+            self._schedule(now + timedelta(seconds=self._interval + self._offset))
+
+    def stop(self):
+        """Cancel the next call."""
+        if self._remove:
+            self._remove()
+            self._remove = None
+
+    def _schedule(self, point_in_time):
+        self._remove = async_track_point_in_utc_time(
+            self._hass, self._async_fire, point_in_time)
+
+    async def _async_fire(self, now):
+        self._schedule(self.next_time(now))
+        try:
+            await self._action(now)
+        except Exception as e:
+            _LOGGER.error(e)
@@ -13,6 +13,7 @@ from homeassistant.const import (
 _LOGGER = logging.getLogger(__name__)
 
 CONF_GROUP_ID = 'group_id'
+CONF_EVENT_DRIVEN = 'event_driven'
 
 DOMAIN = "devicescounter"
 DATA_DEVICESCOUNTER = DOMAIN
@@ -23,6 +24,7 @@ CONFIG_SCHEMA = vol.Schema(
             {
                 vol.Required(CONF_NAME): cv.string,
                 vol.Required(CONF_GROUP_ID): cv.string,
+                vol.Optional(CONF_EVENT_DRIVEN, default=False): cv.boolean,
             }
         )
     },
@@ -32,10 +34,11 @@ CONFIG_SCHEMA = vol.Schema(
 class DevicesCounter:
     """interface of a power monitor."""
 
-    def __init__(self, group_id, conf_name):
+    def __init__(self, group_id, conf_name, event_driven=False):
         """Init function."""
         self._group_id = group_id
         self._name = conf_name
+        self._event_driven = event_driven
 
     @property
     def name(self):
@@ -47,6 +50,11 @@ class DevicesCounter:
         """Return the name of the SwitchMonitor."""
         return self._group_id
 
+    @property
+    def event_driven(self):
+        """Return if the count follows the state changes of the members."""
+        return self._event_driven
+
 
 async def async_setup(hass, config):
     """Set up the asusrouter component."""
@@ -58,7 +66,8 @@ async def async_setup(hass, config):
 
         hass.data[DATA_DEVICESCOUNTER] = DevicesCounter(
             conf[CONF_GROUP_ID],
-            conf[CONF_NAME]
+            conf[CONF_NAME],
+            conf[CONF_EVENT_DRIVEN]
         )
 
     hass.async_create_task(
@@ -1,6 +1,8 @@
 """Asusrouter status sensors."""
 import logging
+from homeassistant.core import callback
 from homeassistant.helpers.entity import Entity
+from homeassistant.helpers.event import async_track_state_change
 from . import DevicesCounter
 from . import DATA_DEVICESCOUNTER
 
@@ -21,11 +23,20 @@ class DevicesCounterSensor(Entity):
         self._name = self._counter.name
         self._hass = hass
         self._state = "0"
+        self._counts = {}
+        self._total = 0
+        self._remove_group_tracker = None
+        self._remove_members_tracker = None
 
     @property
     def name(self):
         return self._name
 
+    @property
+    def should_poll(self):
+        """Poll only when the count does not follow the member states."""
+        return not self._counter.event_driven
+
     @property
     def state(self):
         return self._state
@@ -35,6 +46,90 @@ class DevicesCounterSensor(Entity):
         """Return the unit of measurement."""
         return " "
 
+    @staticmethod
+    def get_client_number(item):
+        """Return the client number of a member state."""
+        if not item:
+            return 0
+        count = item.attributes.get('client_number')
+        if not count:
+            return 0
+        try:
+            return int(count)
+        except (TypeError, ValueError):
+            return 0
+
+    async def async_added_to_hass(self):
+        """Follow the group and its members in event driven mode."""
+        if not self._counter.event_driven:
+            return
+
+        self._remove_group_tracker = async_track_state_change(
+            self._hass, self._counter.group_id, self._async_group_changed)
+        self._async_track_members(self._hass.states.get(self._counter.group_id))
+
+    async def async_will_remove_from_hass(self):
+        """Stop following the state changes."""
+        if self._remove_group_tracker:
+            self._remove_group_tracker()
+            self._remove_group_tracker = None
+        if self._remove_members_tracker:
+            self._remove_members_tracker()
+            self._remove_members_tracker = None
+
+    @callback
+    def _async_track_members(self, id_group):
+        """Count the members once and follow their changes."""
+        if self._remove_members_tracker:
+            self._remove_members_tracker()
+            self._remove_members_tracker = None
+
+        id_list = id_group.attributes.get('entity_id') if id_group else None
+        if not id_list:
+            _LOGGER.error("can not find group : %s", self._counter.group_id)
+            self._counts = {}
+        else:
+            self._counts = {device: self.get_client_number(self._hass.states.get(device))
+                for device in id_list}
+            self._remove_members_tracker = async_track_state_change(
+                self._hass, list(id_list), self._async_member_changed)
+
+        self._total = sum(self._counts.values())
+        self._async_set_total()
+
+    @callback
+    def _async_group_changed(self, entity_id, old_state, new_state):
+        """Count the members again when the group changes."""
+        old_list = old_state.attributes.get('entity_id') if old_state else None
+        new_list = new_state.attributes.get('entity_id') if new_state else None
+        if old_list == new_list and self._remove_members_tracker:
+            return
+        self._async_track_members(new_state)
+
+    @callback
+    def _async_member_changed(self, entity_id, old_state, new_state):
+        """Apply the change of one member to the total."""
+        if entity_id not in self._counts:
+            return
+
+        count = self.get_client_number(new_state)
+        delta = count - self._counts[entity_id]
+        if not delta:
+            return
+
+        self._counts[entity_id] = count
+        self._total += delta
+        self._async_set_total()
+
+    @callback
+    def _async_set_total(self):
+        """Write the state only when the total changed."""
+        state = "%s" % self._total
+        if state == self._state:
+            return
+        self._state = state
+        self.async_write_ha_state()
+
     def get_devices_count(self,id_list):
         count_total = 0
         try:
@@ -54,6 +149,9 @@ class DevicesCounterSensor(Entity):
 
     async def async_update(self):
 
+        if self._counter.event_driven:
+            return
+
         try:
             id_group = self._hass.states.get(self._counter.group_id)
             if id_group :
@@ -16,12 +16,14 @@ from homeassistant.helpers import config_validation as cv
 from homeassistant.helpers.discovery import async_load_platform
 
 from .const import *
+from .registry import RouterRegistry
 from .wrtmqttpub import WrtMqttPub
 
 _LOGGER = logging.getLogger(__name__)
 
 DOMAIN = "ledewrt"
 DATA_LEDEWRT = DOMAIN
+DATA_REGISTRY = "ledewrt_registry"
 
 CONFIG_SCHEMA = vol.Schema(
     {
@@ -50,6 +52,9 @@ ROUTER_CONFIG = vol.Schema(
         vol.Exclusive(CONF_SSH_KEY, SECRET_GROUP): cv.isfile,
         vol.Exclusive(CONF_PUB_KEY, SECRET_GROUP): cv.isfile,
         vol.Optional(CONF_USE_TELNET, default=False): cv.boolean,
+        vol.Optional(CONF_SSH_POOL, default=False): cv.boolean,
+        vol.Optional(CONF_MAX_CHANNELS, default=DEFAULT_MAX_CHANNELS): cv.positive_int,
+        vol.Optional(CONF_KEEPALIVE, default=DEFAULT_KEEPALIVE): cv.positive_int,
     }
 )
 
@@ -63,6 +68,12 @@ CONFIG_SCHEMA = vol.Schema(
                 ),
                 vol.Optional(CONF_ADD_ATTR, default=False): cv.boolean,
                 vol.Optional(CONF_PUB_MQTT, default=""): cv.string,
+                vol.Optional(CONF_PUB_PER_ROUTER, default=False): cv.boolean,
+                vol.Optional(CONF_PUB_COMPRESS, default=False): cv.boolean,
+                vol.Optional(CONF_PUB_MAX_SIZE, default=DEFAULT_PUB_MAX_SIZE): cv.positive_int,
+                vol.Optional(CONF_PUB_INTERVAL, default=DEFAULT_PUB_INTERVAL): cv.positive_int,
+                vol.Optional(CONF_PUB_ALIGN, default=False): cv.boolean,
+                vol.Optional(CONF_PUB_JITTER, default=0): cv.positive_int,
                 vol.Optional(CONF_SR_HOST_ID, default=""): cv.string,
                 vol.Optional(CONF_SR_CACHING_PROXY, default=""): cv.string,
                 vol.Optional(CONF_SR_HOST_PROXY, default=""): cv.string,
@@ -141,7 +152,10 @@ async def async_setup(hass, config):
             conf[CONF_PORT],
             conf[CONF_USERNAME],
             conf.get(CONF_PASSWORD, ""),
-            conf.get(CONF_SSH_KEY, conf.get("pub_key", ""))
+            conf.get(CONF_SSH_KEY, conf.get("pub_key", "")),
+            conf[CONF_SSH_POOL],
+            conf[CONF_MAX_CHANNELS],
+            conf[CONF_KEEPALIVE]
         )
         await router.set_hass(hass)
         await router.set_add_attribute(config[DOMAIN][CONF_ADD_ATTR])
@@ -153,8 +167,16 @@ async def async_setup(hass, config):
 
         routers.append(router)
 
+    registry = RouterRegistry(routers)
+    for router in routers:
+        await router.set_registry(registry)
+
     hass.data[DATA_LEDEWRT] = routers
-    hass.data[DOMAIN_MQTT_PUB] = WrtMqttPub(hass,config[DOMAIN][CONF_PUB_MQTT])
+    hass.data[DATA_REGISTRY] = registry
+    hass.data[DOMAIN_MQTT_PUB] = WrtMqttPub(hass,config[DOMAIN][CONF_PUB_MQTT],
+        config[DOMAIN][CONF_PUB_PER_ROUTER], config[DOMAIN][CONF_PUB_COMPRESS],
+        config[DOMAIN][CONF_PUB_MAX_SIZE], config[DOMAIN][CONF_PUB_INTERVAL],
+        config[DOMAIN][CONF_PUB_ALIGN], config[DOMAIN][CONF_PUB_JITTER])
 
     hass.async_create_task(
         async_load_platform(hass, "sensor", DOMAIN, {}, config)
@@ -166,10 +188,8 @@ async def async_setup(hass, config):
 
     async def _reboot(call):
         """Restart a router."""
-        devices = hass.data[DOMAIN]
-        for device in devices:
-            if device.host == call.data[CONF_HOST]:
-                await device.reboot()
+        for device in registry.find_by_host(call.data[CONF_HOST], allow_all=False):
+            await device.reboot()
             
     hass.services.async_register(
         DOMAIN, SERVICE_REBOOT, _reboot, schema=SERVICE_REBOOT_SCHEMA
@@ -177,10 +197,8 @@ async def async_setup(hass, config):
 
     async def _run_command(call):
         """Restart a router."""
-        devices = hass.data[DOMAIN]
-        for device in devices:
-            if device.host == call.data[CONF_HOST] or call.data[CONF_HOST] == "ALL":
-                await device.run_command(call.data[CONF_COMMAND_LINE])
+        for device in registry.find_by_host(call.data[CONF_HOST]):
+            await device.run_command(call.data[CONF_COMMAND_LINE])
 
     hass.services.async_register(
         DOMAIN, SERVICE_RUNCOMMAND, _run_command, schema=SERVICE_RUN_COMMAND_SCHEMA
@@ -188,10 +206,8 @@ async def async_setup(hass, config):
 
     async def _init_device(call):
         """Restart a router."""
-        devices = hass.data[DOMAIN]
-        for device in devices:
-            if device.host == call.data[CONF_HOST] or call.data[CONF_HOST] == "ALL":
-                await device.init_device(call.data[CONF_COMMAND_LINE])
+        for device in registry.find_by_host(call.data[CONF_HOST]):
+            await device.init_device(call.data[CONF_COMMAND_LINE])
 
     hass.services.async_register(
         DOMAIN, SERVICE_INITDEVICE, _init_device, schema=SERVICE_INIT_DEVICE_SCHEMA
@@ -199,15 +215,13 @@ async def async_setup(hass, config):
 
     async def _set_port_forward(call):
         """Restart a router."""
-        devices = hass.data[DOMAIN]
-        for device in devices:
-            if device.ssid == call.data[CONF_SSID]:
-                await device.set_port_forward(
-                    call.data[CONF_PORT_EXTER],
-                    call.data[CONF_PORT_INNER],
-                    call.data[CONF_PROTOCOL],
-                    call.data[CONF_TARGETHOST]
-                )
+        for device in registry.find_by_ssid(call.data[CONF_SSID]):
+            await device.set_port_forward(
+                call.data[CONF_PORT_EXTER],
+                call.data[CONF_PORT_INNER],
+                call.data[CONF_PROTOCOL],
+                call.data[CONF_TARGETHOST]
+            )
 
     hass.services.async_register(
         DOMAIN, SERVICE_SET_PORT_FORWARD, _set_port_forward, schema=SERVICE_SET_PORTFORWARD_SCHEMA
@@ -215,15 +229,13 @@ async def async_setup(hass, config):
 
     async def _set_vpn_connect(call):
         """Restart a router."""
-        devices = hass.data[DOMAIN]
-        for device in devices:
-            if device.ssid == call.data[CONF_SSID]:
-                await device.set_vpn_connect(
-                    call.data[CONF_VPN_SERVER],
-                    call.data[CONF_VPN_USERNAME],
-                    call.data[CONF_VPN_PASSWORD],
-                    call.data[CONF_VPN_PROTOCOL]
-                )
+        for device in registry.find_by_ssid(call.data[CONF_SSID]):
+            await device.set_vpn_connect(
+                call.data[CONF_VPN_SERVER],
+                call.data[CONF_VPN_USERNAME],
+                call.data[CONF_VPN_PASSWORD],
+                call.data[CONF_VPN_PROTOCOL]
+            )
 
     hass.services.async_register(
         DOMAIN, SERVICE_SET_VPN_CONNECT, _set_vpn_connect, schema=SERVICE_SET_VPN_CONNECT_SCHEMA
@@ -231,10 +243,8 @@ async def async_setup(hass, config):
 
     async def _enable_wifi(call):
         """enable a router wifi."""
-        devices = hass.data[DOMAIN]
-        for device in devices:
-            if device.host == call.data[CONF_HOST] or call.data[CONF_HOST] == "ALL":
-                await device.enable_wifi(call.data[CONF_TYPE_WIFI],call.data[CONF_ENABLE_WIFI])
+        for device in registry.find_by_host(call.data[CONF_HOST]):
+            await device.enable_wifi(call.data[CONF_TYPE_WIFI],call.data[CONF_ENABLE_WIFI])
 
     hass.services.async_register(
         DOMAIN, SERVICE_ENABLE_WIFI, _enable_wifi, schema=SERVICE_ENABLE_WIFI_SCHEMA
@@ -242,10 +252,8 @@ async def async_setup(hass, config):
 
     async def _map_client(call):
         """map all clients in a router."""
-        devices = hass.data[DOMAIN]
-        for device in devices:
-            if device.host == call.data[CONF_HOST] or call.data[CONF_HOST] == "ALL":
-                await device.map_clients(call.data[CONF_PORT_BASE],
+        for device in registry.find_by_host(call.data[CONF_HOST]):
+            await device.map_clients(call.data[CONF_PORT_BASE],
                 call.data[CONF_PORT_INNER], call.data[CONF_PROTOCOL])
 
     hass.services.async_register(
@@ -255,56 +263,51 @@ async def async_setup(hass, config):
     async def _get_adbconn_target(msg):
         """Handle new MQTT messages."""
         param = json.loads(msg.payload)
-        devices = hass.data[DOMAIN]
         _LOGGER.debug("mqtt get adb connect information")
         _LOGGER.debug(param)
-        for device in devices:
-            if device.ssid == param['ssid']:
-                try:
+        for device in registry.find_by_ssid(param['ssid']):
+            try:
 
-                    await device.disable_auto_dns()
-                    await device.set_port_forward(
-                        5555,5555,'TCP',param['target']
-                    )
-                    num_list = device.host.split('.')
-                    mqtt = hass.components.mqtt
-                    msg = "{\"host\": \"%s\", \"domain\": \"%s\", \"public_ip\": \"%s\", \"port\": %s, \"wan2_in_use\": %s}" % (device.host, 
-                        hass.states.get(device.sr_host_id).attributes.get('domain'), 
-                        hass.states.get(device.sr_host_id).attributes.get('record'), 5000+int(num_list[3]), await device.get_wan2_state())
-                    req_id = param.get('requestid')
-                    if req_id:
-                        mqtt.publish("%s/%s" % (CMD_MQTT_TOPIC,req_id), msg)
-                    else:
-                        mqtt.publish(CMD_MQTT_TOPIC, msg)
-
-                except  Exception as e:
-                    _LOGGER.error(e)
+                await device.disable_auto_dns()
+                await device.set_port_forward(
+                    5555,5555,'TCP',param['target']
+                )
+                num_list = device.host.split('.')
+                mqtt = hass.components.mqtt
+                msg = "{\"host\": \"%s\", \"domain\": \"%s\", \"public_ip\": \"%s\", \"port\": %s, \"wan2_in_use\": %s}" % (device.host, 
+                    hass.states.get(device.sr_host_id).attributes.get('domain'), 
+                    hass.states.get(device.sr_host_id).attributes.get('record'), 5000+int(num_list[3]), await device.get_wan2_state())
+                req_id = param.get('requestid')
+                if req_id:
+                    mqtt.publish("%s/%s" % (CMD_MQTT_TOPIC,req_id), msg)
+                else:
+                    mqtt.publish(CMD_MQTT_TOPIC, msg)
+
+            except  Exception as e:
+                _LOGGER.error(e)
 
     async def _get_vpn_account(msg):
         """Handle new MQTT messages."""
         param = json.loads(msg.payload)
-        devices = hass.data[DOMAIN]
         _LOGGER.debug("mqtt get vpn settings")
         _LOGGER.debug(param)
-        for device in devices:
-            if device.vpn_user == param['vpn_user']:
-                try:
-                    mqtt = hass.components.mqtt
-                    msg = "{\"user\": \"%s\",\"state\": \"%s\", \"deviceid\": \"%s\", \"server\": \"%s\", \"connect_state\": \"%s\"}" % (device.vpn_user, 
-                        "inuse" if device.vpn_enabled else "nouse",device.device_name,device.vpn_server,device.device_state)
-                    req_id = param.get('requestid')
-                    if req_id:
-                        mqtt.publish("%s/%s" % (MQTT_VPN_ACCOUNT_TOPIC,req_id), msg)
-                    else:
-                        mqtt.publish(MQTT_VPN_ACCOUNT_TOPIC, msg)
-
-                except  Exception as e:
-                    _LOGGER.error(e)
+        for device in registry.find_by_vpn_user(param['vpn_user']):
+            try:
+                mqtt = hass.components.mqtt
+                msg = "{\"user\": \"%s\",\"state\": \"%s\", \"deviceid\": \"%s\", \"server\": \"%s\", \"connect_state\": \"%s\"}" % (device.vpn_user, 
+                    "inuse" if device.vpn_enabled else "nouse",device.device_name,device.vpn_server,device.device_state)
+                req_id = param.get('requestid')
+                if req_id:
+                    mqtt.publish("%s/%s" % (MQTT_VPN_ACCOUNT_TOPIC,req_id), msg)
+                else:
+                    mqtt.publish(MQTT_VPN_ACCOUNT_TOPIC, msg)
+
+            except  Exception as e:
+                _LOGGER.error(e)
 
     async def _device_offline(msg):
         """Handle new MQTT messages."""
         param = json.loads(msg.payload)
-        devices = hass.data[DOMAIN]
         offline_list = param['offline_list']
         _LOGGER.debug("mqtt try to resume devices")
         _LOGGER.debug(param)
@@ -314,19 +317,16 @@ async def async_setup(hass, config):
         for offline_item in offline_list:
             try:
 
-                for device in devices:
+                for device in registry.find_by_device_id(offline_item['id']):
 
                     if offline_item['online'] > device.get_max_offine(hass):
                         continue
 
-                    if not device.match_device_id(offline_item['id']):
-                        continue
-
                     if not device.wifi_enabled:
                         _LOGGER.warning("router %s is not enabled" % (device.device_name))
                         continue
 
-                    if device.public_ip == "":
+                    if not device.public_ip:
                         continue
                     if device.public_ip == "0.0.0.0":
                         continue
@@ -340,14 +340,10 @@ async def async_setup(hass, config):
     async def _change_vpn_user(msg):
         """Handle new MQTT messages."""
         param = json.loads(msg.payload)
-        devices = hass.data[DOMAIN]
         _LOGGER.debug("mqtt change vpn connect setting")
         _LOGGER.debug(param)
         try:
-            for device in devices:
-
-                if not device.match_device_id(param['id']):
-                        continue
+            for device in registry.find_by_device_id(param['id']):
 
                 if await device.get_wan2_state() == 1:
                     _LOGGER.warning("mqtt change router's (%s)  vpn server error. can not change with more wans" % device.device_name)
@@ -373,7 +369,6 @@ async def async_setup(hass, config):
 
     async def _mqtt_map_client(msg):
         param = json.loads(msg.payload)
-        devices = hass.data[DOMAIN]
         _LOGGER.debug("mqtt map all client on device")
         _LOGGER.debug(param)
 
@@ -403,11 +398,8 @@ async def async_setup(hass, config):
             protocol = "TCP"
 
         try:
-            for device in devices:
+            for device in registry.find_by_device_id(param['id']):
 
-                if not device.match_device_id(param['id']):
-                        continue
-                
                 map_list = await device.map_clients(base_port,
                     inner_port, protocol)
 
@@ -2,19 +2,29 @@
 import asyncio
 import logging
 from asyncio import LimitOverrunError, TimeoutError
+from datetime import datetime, timedelta
 
 import asyncssh
 
 _LOGGER = logging.getLogger(__name__)
 
 _PATH_EXPORT_COMMAND = "PATH=$PATH:/bin:/usr/sbin:/sbin"
+_SHELL_MARKER = "__LEDEWRT_END_%s__"
 asyncssh.set_log_level('WARNING')
 
+COMMAND_TIMEOUT = 9
+DEFAULT_MAX_CHANNELS = 4
+DEFAULT_KEEPALIVE = 30
+RECONNECT_DELAY_MIN = 5
+RECONNECT_DELAY_MAX = 300
+
 
 class SshConnection:
     """Maintains an SSH connection to an router."""
 
-    def __init__(self, host, port, username, password, ssh_key):
+    def __init__(self, host, port, username, password, ssh_key,
+                 pool=False, max_channels=DEFAULT_MAX_CHANNELS,
+                 keepalive=DEFAULT_KEEPALIVE):
         """Initialize the SSH connection properties."""
 
         self._connected = False
@@ -26,37 +36,117 @@ class SshConnection:
         self._client = None
         self.last_error = None
 
+        self._pool = pool
+        self._keepalive = keepalive
+        self._channels = asyncio.Semaphore(max_channels)
+        self._shell = None
+        self._shell_lock = asyncio.Lock()
+        self._shell_index = 0
+        self._connect_lock = asyncio.Lock()
+        self._reconnect_delay = 0
+        self._next_connect = None
+
     async def async_run_command(self, command, retry=False):
         """Run commands through an SSH connection.
 
         Connect to the SSH server if not currently connected, otherwise
         use the existing connection.
         """
-        self._last_error = None
+        if self._pool:
+            return await self.async_run_pooled_command(command)
+
+        self.last_error = None
 
         if not self.is_connected:
             await self.async_connect()
         try:
             result = await asyncio.wait_for(self._client.run(
-                "%s && %s" % (_PATH_EXPORT_COMMAND, command)), 9)
+                "%s && %s" % (_PATH_EXPORT_COMMAND, command)), COMMAND_TIMEOUT)
         except asyncssh.misc.ChannelOpenError:
             if not retry:
                 await self.async_connect()
-                return self.async_run_command(command, retry=True)
+                return await self.async_run_command(command, retry=True)
             else:
                 self._connected = False
-                _LOGGER.error("No connection to host")
+                self.last_error = "No connection to host"
+                _LOGGER.error(self.last_error)
                 return []
         except TimeoutError:
             del self._client
             self._connected = False
-            _LOGGER.error("Host timeout.")
+            self.last_error = "Host timeout."
+            _LOGGER.error(self.last_error)
             return []
 
         self._connected = True
         self.last_error = result.stderr
         return result.stdout.split('\n')
 
+    async def async_run_pooled_command(self, command):
+        """Run a command on the shared shell, or a spare channel if it is busy."""
+        self.last_error = None
+
+        try:
+            if not self.is_connected:
+                await self.async_connect()
+
+            async with self._channels:
+                if self._shell_lock.locked():
+                    stdout, stderr = await asyncio.wait_for(
+                        self._async_run_channel(command), COMMAND_TIMEOUT)
+                else:
+                    async with self._shell_lock:
+                        try:
+                            stdout, stderr = await asyncio.wait_for(
+                                self._async_run_shell(command), COMMAND_TIMEOUT)
+                        except Exception:
+                            self._close_shell()
+                            raise
+
+        except TimeoutError:
+            self.last_error = "Host %s timeout." % self._host
+            _LOGGER.error(self.last_error)
+            return []
+        except (asyncssh.Error, OSError, asyncio.IncompleteReadError) as e:
+            self._connected = False
+            self.last_error = "No connection to host %s : %s" % (self._host, e)
+            _LOGGER.error(self.last_error)
+            return []
+
+        self.last_error = stderr
+        return stdout.split('\n')
+
+    async def _async_run_channel(self, command):
+        """Run a command on its own exec channel."""
+        result = await self._client.run(
+            "%s && %s" % (_PATH_EXPORT_COMMAND, command))
+        return result.stdout, result.stderr
+
+    async def _async_run_shell(self, command):
+        """Run a command on the long lived shell, delimited by a marker."""
+        if not self._shell:
+            self._shell = await self._client.create_process()
+            self._shell.stdin.write("%s\n" % _PATH_EXPORT_COMMAND)
+
+        self._shell_index += 1
+        marker = _SHELL_MARKER % self._shell_index
+
+        self._shell.stdin.write(
+            "{ %s\n} < /dev/null\nprintf '\\n%s\\n'\nprintf '%s\\n' >&2\n"
+            % (command, marker, marker))
+
+        stdout = await self._shell.stdout.readuntil("\n%s\n" % marker)
+        stderr = await self._shell.stderr.readuntil("%s\n" % marker)
+
+        return (stdout[:-len("\n%s\n" % marker)],
+            stderr[:-len("%s\n" % marker)])
+
+    def _close_shell(self):
+        """Drop the shell, its output can not be trusted anymore."""
+        if self._shell:
+            self._shell.close()
+        self._shell = None
+
     @property
     def is_connected(self):
         """Do we have a connection."""
@@ -73,5 +163,36 @@ class SshConnection:
             'known_hosts': None
         }
 
-        self._client = await asyncssh.connect(self._host, **kwargs)
-        self._connected = True
\ No newline at end of file
+        if not self._pool:
+            self._client = await asyncssh.connect(self._host, **kwargs)
+            self._connected = True
+            return
+
+        async with self._connect_lock:
+            if self._connected:
+                return
+
+            now = datetime.utcnow()
+            if self._next_connect and now < self._next_connect:
+                raise ConnectionError("reconnect to %s delayed %ss" % (
+                    self._host, self._reconnect_delay))
+
+            self._close_shell()
+            if self._client:
+                self._client.close()
+                self._client = None
+
+            kwargs['keepalive_interval'] = self._keepalive
+
+            try:
+                self._client = await asyncssh.connect(self._host, **kwargs)
+            except Exception:
+                self._reconnect_delay = min(RECONNECT_DELAY_MAX,
+                    max(RECONNECT_DELAY_MIN, self._reconnect_delay * 2))
+                self._next_connect = datetime.utcnow() + timedelta(
+                    seconds=self._reconnect_delay)
+                raise
+
+            self._reconnect_delay = 0
+            self._next_connect = None
+            self._connected = True
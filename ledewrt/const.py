@@ -4,8 +4,17 @@ CONF_PUB_KEY = "pub_key"
 CONF_SENSORS = "sensors"
 CONF_SSH_KEY = "ssh_key"
 CONF_USE_TELNET = "use_telnet"
+CONF_SSH_POOL = "ssh_pool"
+CONF_MAX_CHANNELS = "max_channels"
+CONF_KEEPALIVE = "keepalive"
 CONF_ADD_ATTR = "add_attribute"
 CONF_PUB_MQTT = "pub_mqtt"
+CONF_PUB_PER_ROUTER = "pub_per_router"
+CONF_PUB_COMPRESS = "pub_compress"
+CONF_PUB_MAX_SIZE = "pub_max_size"
+CONF_PUB_INTERVAL = "pub_interval"
+CONF_PUB_ALIGN = "pub_align"
+CONF_PUB_JITTER = "pub_jitter"
 CONF_SR_HOST_ID = "sr_host_id"
 CONF_SR_CACHING_PROXY = "sr_caching_proxy"
 CONF_SR_HOST_PROXY = "sr_host_proxy"
@@ -37,7 +46,11 @@ DOMAIN_MQTT_PUB = "router_mqtt_pub"
 CONF_ROUTERS = "routers"
 
 DEFAULT_SSH_PORT = 22
+DEFAULT_MAX_CHANNELS = 4
+DEFAULT_KEEPALIVE = 30
 DEFAULT_MAX_OFFINLE = 5
+DEFAULT_PUB_MAX_SIZE = 65536
+DEFAULT_PUB_INTERVAL = 60
 
 CMD_MQTT_TOPIC = "router_monitor/global/commad/on_get_adbconn_target"
 MQTT_VPN_ACCOUNT_TOPIC = "router_monitor/global/commad/on_get_vpn_account"
@@ -1,21 +1,161 @@
 """Module for LedeWrt."""
 import inspect
+import json
 import logging
 import math
 import re
+import shlex
 
 from collections import namedtuple
 from .connection import SshConnection
+from .publicip import PublicIpResolver
 from datetime import datetime
 
 _LOGGER = logging.getLogger(__name__)
 
 from .const import DOMAIN_MQTT_PUB, CONF_NAME_2GWIFI, CONF_NAME_5GWIFI
+from .const import DEFAULT_MAX_CHANNELS, DEFAULT_KEEPALIVE
 
 _RX_COMMAND = "cat /sys/class/net/{}/statistics/rx_bytes"
 _TX_COMMAND = "cat /sys/class/net/{}/statistics/tx_bytes"
 
+_UCI_SHOW_COMMAND = "uci show %s"
+_UCI_CLEAR_COMMAND = "while uci -q delete %s; do :; done"
+_UCI_BATCH_EOF = "UCI_BATCH_EOF"
+
+_WIRELESS_CLIENTS_COMMAND = "for obj in $(ubus list 'hostapd.*'); do "\
+    "ubus -S call $obj get_clients; done"
+_ARP_LIST_COMMAND = "cat /proc/net/arp"
+_ARP_INCOMPLETE_MAC = "00:00:00:00:00:00"
+
 CHANGE_TIME_CACHE_DEFAULT = 5  # Default 5s
+ARP_CACHE_DEFAULT = 60  # Default 60s
+
+
+def parse_uci_value(value):
+    """Unquote a uci show value, a list option becomes a list."""
+    try:
+        values = shlex.split(value)
+    except ValueError:
+        return value
+
+    if len(values) == 1:
+        return values[0]
+    return values
+
+
+def parse_uci_show(lines):
+    """Parse the output of uci show into sections, in config order."""
+    sections = []
+    by_name = {}
+
+    for line in lines:
+        key, sep, value = line.partition('=')
+        if not sep:
+            continue
+
+        path = key.split('.')
+        if len(path) == 2:
+            section = {".name": path[1], ".type": value}
+            by_name[path[1]] = section
+            sections.append(section)
+        elif len(path) == 3:
+            section = by_name.get(path[1])
+            if section is not None:
+                section[path[2]] = parse_uci_value(value)
+
+    return sections
+
+
+class ArpTable:
+    """The router arp table, keyed by mac."""
+
+    def __init__(self, cache_time=ARP_CACHE_DEFAULT):
+        self._ip_by_mac = {}
+        self._cache_time = cache_time
+        self._timer = None
+
+    def update(self, lines):
+        """Replace the table from the lines of /proc/net/arp."""
+        ip_by_mac = {}
+        for line in lines[1:]:
+            fields = line.split()
+            if len(fields) < 4:
+                continue
+            mac = fields[3].lower()
+            if fields[2] == "0x0" or mac == _ARP_INCOMPLETE_MAC:
+                continue
+            ip_by_mac[mac] = fields[0]
+
+        self._ip_by_mac = ip_by_mac
+        self._timer = datetime.utcnow()
+
+    def need_refresh(self, macs):
+        """Return if the table is stale or misses one of the macs."""
+        if not self._timer:
+            return True
+
+        if self._cache_time < (datetime.utcnow() - self._timer).total_seconds():
+            return True
+
+        for mac in macs:
+            if mac not in self._ip_by_mac:
+                return True
+
+        return False
+
+    def get_ip(self, mac):
+        """Return the ip of the mac."""
+        return self._ip_by_mac.get(mac)
+
+
+def uci_quote(value):
+    """Quote a value for uci batch."""
+    return "'%s'" % str(value).replace("'", "'\\''")
+
+
+class UciBatch:
+    """Build the desired uci state as one batch, committed once."""
+
+    def __init__(self):
+        self._clear = []
+        self._lines = []
+        self._packages = []
+
+    def _use_package(self, package):
+        if package not in self._packages:
+            self._packages.append(package)
+
+    def clear(self, package, section_type):
+        """Delete every section of the type."""
+        self._use_package(package)
+        self._clear.append(_UCI_CLEAR_COMMAND % ("%s.@%s[0]" % (
+            package, section_type)))
+
+    def add(self, package, section_type, options):
+        """Add an anonymous section with its options."""
+        self._use_package(package)
+        self._lines.append("add %s %s" % (package, section_type))
+        for option, value in options:
+            self._lines.append("set %s.@%s[-1].%s=%s" % (
+                package, section_type, option, uci_quote(value)))
+
+    def set(self, option, value):
+        """Set an option, e.g. network.wan.peerdns."""
+        self._use_package(option.split('.')[0])
+        self._lines.append("set %s=%s" % (option, uci_quote(value)))
+
+    def command(self):
+        """Return the shell command applying the batch."""
+        lines = list(self._lines)
+        for package in self._packages:
+            lines.append("commit %s" % package)
+
+        commands = list(self._clear)
+        commands.append("uci batch <<'%s'\n%s\n%s" % (
+            _UCI_BATCH_EOF, '\n'.join(lines), _UCI_BATCH_EOF))
+        return ';'.join(commands)
+
 
 class route_config:
 
@@ -36,6 +176,18 @@ class route_config:
                     self.netmask = params[1]
                     self.target = params[0].strip('<')
 
+    @classmethod
+    def from_uci(cls, section):
+        route = cls()
+        route.interface = section.get("interface", route.interface)
+        route.target = section.get("target", route.target)
+        route.gateway = section.get("gateway", route.gateway)
+        route.netmask = section.get("netmask", route.netmask)
+        return route
+
+    def key(self):
+        return (self.interface, self.target, self.gateway, self.netmask)
+
 class dns_config:
 
     def __init__(self, conf=""):
@@ -47,16 +199,28 @@ class dns_config:
                 self.name = conf_list[1]
                 self.ip = conf_list[0]
 
+    @classmethod
+    def from_uci(cls, section):
+        dns = cls()
+        dns.name = section.get("name")
+        dns.ip = section.get("ip")
+        return dns
+
+    def key(self):
+        return (self.name, self.ip)
+
 
 class LedeWrt:
     """This is the interface class."""
 
     def __init__(self, host, name, port=None, username=None,
-                 password=None, ssh_key=None):
+                 password=None, ssh_key=None, ssh_pool=False,
+                 max_channels=DEFAULT_MAX_CHANNELS, keepalive=DEFAULT_KEEPALIVE):
         """Init function."""
         self._device_name = name
         self.connection = SshConnection(
-            host, port, username, password, ssh_key)
+            host, port, username, password, ssh_key,
+            ssh_pool, max_channels, keepalive)
         self._host = host
         self._connect_failed = False
         self._add_attribute = False
@@ -70,15 +234,18 @@ class LedeWrt:
         self._vpn_enabled = False
         self._vpn_user = False
         self._vpn_server = False
-        self._public_ip = "0.0.0.0"
+        self._public_ip = None
         self._ssid = ""
         self._last_vpn_restart_time = None
         self._max_offline_setting = None
         self._wifi_enabled = False
         self._hass = None
+        self._registry = None
         self._device_sn = None
         self._device_state = 0
         self._client_ip_list = []
+        self._public_ip_resolver = PublicIpResolver(self.connection)
+        self._arp_table = ArpTable()
         self.interface = "eth0"
 
         self._last_cmd = None
@@ -183,11 +350,16 @@ class LedeWrt:
         return self._wifi_enabled
 
     async def set_ssid(self, ssid):
+        if self._registry and ssid != self._ssid:
+            self._registry.update_ssid(self, self._ssid, ssid)
         self._ssid = ssid
 
     async def set_hass(self, hass):
         self._hass = hass
 
+    async def set_registry(self, registry):
+        self._registry = registry
+
     async def set_wifi_enabled(self, enabled):
         self._wifi_enabled = enabled
 
@@ -218,7 +390,19 @@ class LedeWrt:
     async def set_public_ip(self, public_ip):
         self._public_ip = public_ip
 
+    async def async_update_public_ip(self):
+        """Refresh the public ip once its cache expired."""
+        public_ip = await self._public_ip_resolver.async_get_public_ip()
+        if public_ip:
+            await self.set_public_ip(public_ip)
+
+    def invalidate_public_ip(self):
+        """Resolve the public ip again on the next update."""
+        self._public_ip_resolver.invalidate()
+
     async def set_vpn_user(self, vpn_user):
+        if self._registry and vpn_user != self._vpn_user:
+            self._registry.update_vpn_user(self, self._vpn_user, vpn_user)
         self._vpn_user = vpn_user
 
     async def set_vpn_server(self, vpn_server):
@@ -301,6 +485,37 @@ class LedeWrt:
         )
         return self._latest_transfer_data
     
+    async def async_get_wireless_macs(self):
+        """Get the macs of the clients on every hostapd interface."""
+        lines = await self.connection.async_run_command(
+            _WIRELESS_CLIENTS_COMMAND)
+
+        macs = set()
+        for line in lines or []:
+            if not line:
+                continue
+            clients = json.loads(line).get("clients", {})
+            macs.update(mac.lower() for mac in clients)
+
+        return macs
+
+    async def async_update_wireless_clients(self):
+        """Update the wireless clients and their ip."""
+        macs = await self.async_get_wireless_macs()
+
+        if macs and self._arp_table.need_refresh(macs):
+            self._arp_table.update(await self.connection.async_run_command(
+                _ARP_LIST_COMMAND) or [])
+
+        client_ip_list = []
+        for mac in macs:
+            ip = self._arp_table.get_ip(mac)
+            if ip:
+                client_ip_list.append(ip)
+
+        await self.set_client_ip_list(client_ip_list)
+        await self.set_client_number(len(client_ip_list))
+
     def get_max_offine(self, hass):
         """get max offine."""
         if not self._max_offline_setting:
@@ -342,50 +557,34 @@ class LedeWrt:
 
         return "wan2"
 
-    async def get_custom_dns(self):
-        """Get router static routing."""
-        dns_list = []
-        try:
-
-            conf_index = 0
-
-            while True:
-                
-                dns = dns_config("")
-                value_get = await self.run_cmdline(
-                    "uci get dhcp.@domain[%s].name;" % conf_index)
-                if self.connection.last_error:
-                    break
-                if value_get:
-                    dns.name = value_get[0]
-
-                value_get = await self.run_cmdline(
-                    "uci get dhcp.@domain[%s].ip;" % conf_index)
-                if value_get:
-                    dns.ip = value_get[0]
-
-                dns_list.append(dns)
+    async def async_uci_show(self, package, section_type=None):
+        """Read a whole uci package in one command."""
+        lines = await self.run_cmdline(_UCI_SHOW_COMMAND % package)
+        if not lines or self.connection.last_error:
+            return []
 
-                conf_index += 1
+        sections = parse_uci_show(lines)
+        if section_type:
+            return [section for section in sections
+                if section[".type"] == section_type]
+        return sections
 
-            return dns_list
+    async def get_custom_dns(self):
+        """Get router custom dns."""
+        try:
+            return [dns_config.from_uci(section)
+                for section in await self.async_uci_show("dhcp", "domain")]
 
         except  Exception as e:
             _LOGGER.error(e)
             return []
 
     async def need_update_dns(self, update_list):
-        dns_list = await self.get_custom_dns()
-        update_dns_list = list(update_list)
+        dns_keys = set(dns.key() for dns in await self.get_custom_dns())
 
-        for dns in dns_list:
-           for update_dns in update_dns_list:
-               if dns.name == update_dns.name \
-                   and dns.ip == update_dns.ip:
-                   update_dns_list.remove(update_dns)
-
-        if len(update_dns_list) > 0:
-            return True
+        for update_dns in update_list:
+            if update_dns.key() not in dns_keys:
+                return True
 
         return False
 
@@ -396,16 +595,14 @@ class LedeWrt:
                 return
 
             _LOGGER.debug("update new dns")
-            await self.reset_network_setting("dhcp.@domain[0]")
+            batch = UciBatch()
+            batch.clear("dhcp", "domain")
 
             for dns in new_dns_list:
-                add_dns = await self.run_cmdline('uci add dhcp domain')
-                if not add_dns:
-                    return
+                batch.add("dhcp", "domain", [("name", dns.name), ("ip", dns.ip)])
 
-                await self.run_cmdline(
-                    "uci set dhcp.%s.name='%s';""uci set network.%s.ip='%s'; uci commit;"\
-                         % (add_dns[0],dns.name, add_dns[0], dns.ip))
+            if not await self.run_uci_batch(batch):
+                return
 
             await self.run_cmdline("/etc/init.d/dnsmasq restart")
 
@@ -474,6 +671,7 @@ class LedeWrt:
             await self.run_cmdline("ubus call network.interface.vpn0 renew")
         else:
             await self.run_cmdline("reboot")
+        self.invalidate_public_ip()
 
     async def disable_auto_dns(self):
 
@@ -495,6 +693,7 @@ class LedeWrt:
                 self.host_to_gateway())
 
             await self.run_cmdline(cmd)
+            self.invalidate_public_ip()
 
         except  Exception as e:
             _LOGGER.error(e)
@@ -548,7 +747,8 @@ class LedeWrt:
             cmd = "uci set network.vpn0.server='%s';uci set network.vpn0.username='%s'"\
                     "uci set network.vpn0.password='%s';uci set network.vpn0.proto='%s'"\
                        "uci commit ; /etc/init.d/network restart" % (server,name,password,protocol)
-        await self.run_cmdline(cmd)    
+        await self.run_cmdline(cmd)
+        self.invalidate_public_ip()
 
     async def enable_wifi(self, type, enable):
         cmd = None
@@ -562,6 +762,7 @@ class LedeWrt:
 
         if cmd:
             await self.run_cmdline(cmd)
+            self.invalidate_public_ip()
 
     async def map_clients(self, base_port, inner_port, protocol):
         
@@ -611,104 +812,67 @@ class LedeWrt:
 
     async def get_static_routing(self):
         """Get router static routing."""
-        rules = []
         try:
-
-            route_index = 0
-
-            while True:
-                
-                route = route_config("")
-                value_get = await self.run_cmdline(
-                    "uci get network.@route[%s].interface;" % route_index)
-                if self.connection.last_error:
-                    break
-                if value_get:
-                    route.interface = value_get[0]
-
-                value_get = await self.run_cmdline(
-                    "uci get network.@route[%s].target;" % route_index)
-                if value_get:
-                    route.target = value_get[0]
-
-                value_get = await self.run_cmdline(
-                    "uci get network.@route[%s].gateway;" % route_index)
-                if value_get:
-                    route.gateway = value_get[0]
-
-                value_get = await self.run_cmdline(
-                    "uci get network.@route[%s].netmask;" % route_index)
-                if value_get:
-                    route.netmask = value_get[0]
-
-                rules.append(route)
-
-                route_index += 1
-
-            return rules
+            return [route_config.from_uci(section)
+                for section in await self.async_uci_show("network", "route")]
 
         except  Exception as e:
             _LOGGER.error(e)
             return []
 
     async def need_add_static_routing(self, add_target):
-        rules_list = await self.get_static_routing()
-        rulelist_add = list(add_target)
-
-        for rule in rules_list:
-           for rule_add in rulelist_add:
-               if rule_add.interface == rule.interface \
-                   and rule_add.target == rule.target \
-                   and rule_add.gateway == rule.gateway \
-                   and rule_add.netmask == rule.netmask:
-                   rulelist_add.remove(rule_add)
-
-        if len(rulelist_add) > 0:
-            return True
+        rule_keys = set(rule.key() for rule in await self.get_static_routing())
+
+        for rule_add in add_target:
+            if rule_add.key() not in rule_keys:
+                return True
 
         return False
 
+    async def run_uci_batch(self, batch):
+        """Apply a uci batch in one command."""
+        result = await self.run_cmdline(batch.command())
+        if result is None:
+            return False
+
+        if self.connection.last_error:
+            _LOGGER.error("uci batch failed on %s : %s",
+                self._device_name, self.connection.last_error)
+            return False
+
+        return True
+
     async def reset_network_setting(self, network_setting):
         """Reset router static routing."""
         try:
-            go_next = True
-            while go_next:
-
-                run_error = await self.run_cmdline(
-                    "uci delete %s; uci commit" % (network_setting))
-
-                if self.connection.last_error:
-                    go_next = False
+            await self.run_cmdline("%s; uci commit %s" % (
+                _UCI_CLEAR_COMMAND % network_setting,
+                network_setting.split('.')[0]))
 
         except  Exception as e:
             _LOGGER.error(e)
 
     async def set_static_routing(self, new_route_list):
-        """Get router static routing."""
+        """Replace router static routing."""
         try:
             if len(new_route_list) == 0:
-                return rules
+                return
 
             _LOGGER.debug("update static routing")
-            await self.reset_network_setting("network.@route[0]")
+            batch = UciBatch()
+            batch.clear("network", "route")
 
             for route in new_route_list:
-                add_route = await self.run_cmdline('uci add network route')
-                if not add_route:
-                    return []
-
-                await self.run_cmdline(
-                    "uci set network.%s.interface='%s';"\
-                        "uci set network.%s.target='%s';"\
-                        "uci set network.%s.gateway='%s';"\
-                        "uci set network.%s.netmask='%s'; uci commit;"\
-                         % (add_route[0],route.interface,
-                        add_route[0],route.target,add_route[0],route.gateway,
-                        add_route[0],route.netmask))
+                batch.add("network", "route", [
+                    ("interface", route.interface),
+                    ("target", route.target),
+                    ("gateway", route.gateway),
+                    ("netmask", route.netmask)])
+
+            await self.run_uci_batch(batch)
 
         except  Exception as e:
             _LOGGER.error(e)
-            return []
  
 
     async def update_static_routing(self):
@@ -0,0 +1,207 @@
+"""Public ip resolver for ledewrt."""
+import json
+import logging
+from datetime import datetime
+from re import compile
+
+_LOGGER = logging.getLogger(__name__)
+
+_IP_REGEX = compile(r'((?<![\.\d])(?:\d{1,3}\.){3}\d{1,3}(?![\.\d]))')
+_CITY_JSON_REGEX = compile(r'{[^}]+}')
+
+_PROBE_FILE = "/tmp/public_ip.%s"
+_PROBE_MARKER = "==public_ip:"
+_PROBE_READ_COMMAND = 'echo "%s%s"; cat %s 2>/dev/null; rm -f %s'
+_PROBE_START_COMMAND = "(wget -q -T 20 -O %s '%s' >/dev/null 2>&1 &)"
+
+PUBLIC_IP_CACHE_DEFAULT = 300  # Default 300s
+PUBLIC_IP_RETRY_DEFAULT = 30  # Default 30s
+NO_PUBLIC_IP = "0.0.0.0"
+
+PROVIDER_SCORE_MIN = 0.2
+PROVIDER_SCORE_DECAY = 0.7
+PROVIDER_RETRY_ROUNDS = 10
+
+
+def parse_ipip(content):
+    """Parse myip.ipip.net, the ip and its location."""
+    ip_split = content.split('：')
+    if len(ip_split) < 3:
+        return None
+
+    ip_regx = _IP_REGEX.findall(ip_split[1])
+    if not ip_regx:
+        return None
+    return "%s    %s" % (ip_regx[0], ip_split[2].replace('中国 ', '').strip())
+
+
+def parse_cityjson(content):
+    """Parse the sohu cityjson, the ip and its city."""
+    ip_dict_regx = _CITY_JSON_REGEX.findall(content)
+    if not ip_dict_regx:
+        return None
+
+    ip_dict = json.loads(ip_dict_regx[0])
+    if not ip_dict.get('cip'):
+        return None
+    return "%s    %s" % (ip_dict['cip'], ip_dict.get('cname'))
+
+
+def parse_plain_ip(content):
+    """Parse a provider answering only the ip."""
+    ip_regx = _IP_REGEX.findall(content)
+    if not ip_regx:
+        return None
+    return ip_regx[0]
+
+
+class IpProvider:
+    """A public ip provider and its health."""
+
+    def __init__(self, name, url, parser):
+        self.name = name
+        self.url = url
+        self._parser = parser
+        self.score = 1.0
+        self._skipped = 0
+
+    def parse(self, content):
+        """Return the public ip in the content, or None."""
+        try:
+            return self._parser(content)
+        except Exception as e:
+            _LOGGER.debug("%s answered %s : %s", self.name, content, e)
+            return None
+
+    def report(self, success):
+        """Record the outcome of a probe."""
+        self.score = self.score * PROVIDER_SCORE_DECAY
+        if success:
+            self.score += 1 - PROVIDER_SCORE_DECAY
+
+    def should_probe(self):
+        """Return if the provider is healthy, or due for a retry."""
+        if self.score >= PROVIDER_SCORE_MIN:
+            return True
+
+        self._skipped += 1
+        if self._skipped < PROVIDER_RETRY_ROUNDS:
+            return False
+
+        self._skipped = 0
+        return True
+
+
+class PublicIpResolver:
+    """Resolve the public ip of a router with background probes on the router.
+
+    One command reads the answers of the probes started last time and starts
+    new ones for the healthy providers, the ip is then cached. The last known
+    ip is kept until a probe round answers, it is only dropped when every
+    provider of a round failed.
+    """
+
+    def __init__(self, connection, cache_time=PUBLIC_IP_CACHE_DEFAULT,
+                 retry_time=PUBLIC_IP_RETRY_DEFAULT):
+        self._connection = connection
+        self._cache_time = cache_time
+        self._retry_time = retry_time
+        self._providers = [
+            IpProvider("ipip", "http://myip.ipip.net", parse_ipip),
+            IpProvider("sohu", "http://pv.sohu.com/cityjson?ie=utf-8", parse_cityjson),
+            IpProvider("3322", "http://members.3322.org/dyndns/getip", parse_plain_ip),
+        ]
+        self._pending = set()
+        self._public_ip = None
+        self._confirmed = False
+        self._timer = None
+
+    @property
+    def public_ip(self):
+        """Return the cached public ip, None while it is not known yet."""
+        return self._public_ip
+
+    @property
+    def provider_scores(self):
+        """Return the health of every provider."""
+        return {provider.name: round(provider.score, 2)
+            for provider in self._providers}
+
+    def invalidate(self):
+        """Probe again on the next call, e.g. after the wan restarted.
+
+        The answers of the probes started before are discarded, they may
+        hold the old ip.
+        """
+        self._timer = None
+        self._pending = set()
+        self._confirmed = False
+
+    def need_refresh(self):
+        """Return if the cached ip expired."""
+        if not self._timer:
+            return True
+
+        if self._confirmed and self._public_ip != NO_PUBLIC_IP:
+            cache_time = self._cache_time
+        else:
+            cache_time = self._retry_time
+        return cache_time < (datetime.utcnow() - self._timer).total_seconds()
+
+    def probe_command(self, providers):
+        """Return the command reading the last answers and starting new probes."""
+        commands = []
+        for provider in self._providers:
+            probe_file = _PROBE_FILE % provider.name
+            commands.append(_PROBE_READ_COMMAND % (
+                _PROBE_MARKER, provider.name, probe_file, probe_file))
+
+        for provider in providers:
+            commands.append(_PROBE_START_COMMAND % (
+                _PROBE_FILE % provider.name, provider.url))
+
+        return '; '.join(commands)
+
+    def parse_probe(self, lines):
+        """Split the probe output into the answer of each provider."""
+        answers = {}
+        name = None
+        for line in lines:
+            if line.startswith(_PROBE_MARKER):
+                name = line[len(_PROBE_MARKER):]
+                answers[name] = ""
+            elif name:
+                answers[name] += line
+
+        return answers
+
+    async def async_get_public_ip(self, use_cache=True):
+        """Return the public ip, probing again when the cache expired."""
+        if use_cache and not self.need_refresh():
+            return self.public_ip
+
+        providers = [provider for provider in self._providers
+            if provider.should_probe()]
+
+        lines = await self._connection.async_run_command(
+            self.probe_command(providers))
+        answers = self.parse_probe(lines or [])
+
+        public_ip = None
+        for provider in sorted(self._providers,
+                key=lambda provider: provider.score, reverse=True):
+            if provider.name not in self._pending:
+                continue
+
+            provider_ip = provider.parse(answers.get(provider.name, ""))
+            provider.report(provider_ip is not None)
+            if provider_ip and not public_ip:
+                public_ip = provider_ip
+
+        if self._pending:
+            self._public_ip = public_ip or NO_PUBLIC_IP
+            self._confirmed = True
+
+        self._pending = set(provider.name for provider in providers)
+        self._timer = datetime.utcnow()
+        return self.public_ip
@@ -3,7 +3,6 @@ import logging
 import json
 from datetime import datetime
 from homeassistant.helpers.entity import Entity
-from re import compile
 
 from . import DATA_LEDEWRT
 
@@ -17,13 +16,8 @@ _STATES_DISABLED_WIFI_5G_CMD = 'uci get wireless.@wifi-iface[1].disabled'
 
 _WIFI_CHANNEL_5G_CMD = 'uci get wireless.@wifi-device[1].channel'
 
-WIRELESS_CLIENTS_COMMAND = 'ubus call hostapd.wlan1 get_clients'
-_ARP_LIST_COMMAND = 'cat /proc/net/arp'
-
 _CONF_VPN_PROTO_DEFAULE = 'disable'
 
-_IP_REGEX = compile(r'((?<![\.\d])(?:\d{1,3}\.){3}\d{1,3}(?![\.\d]))')
-
 
 async def async_setup_platform(hass, config, add_entities, discovery_info=None):
     """Set up the lederouter."""
@@ -144,50 +138,10 @@ class LedeSensor(Entity):
 
     async def async_get_public_ip(self):
         """Get current public ip."""
-        public_ip = None
         try:
-
-            ip_content = await self._lederouter.connection.async_run_command('cat getip')
-            if ip_content:
-                ip_split = ip_content[0].split('：')
-                if len(ip_split) > 2:
-                    ip_regx = _IP_REGEX.findall(ip_split[1])
-                    if ip_regx:
-                        public_ip = "%s    %s" % (ip_regx[0],ip_split[2].replace('中国 ', ''))
-
-            await self._lederouter.connection.async_run_command('rm getip')
-            await self._lederouter.connection.async_run_command(
-                "wget  -q -T 20 -b -O getip myip.ipip.net")
-
-            if not public_ip:
-                ip_content = await self._lederouter.connection.async_run_command('cat getip1')
-                if ip_content:
-                    ip_dict_regx = compile(r'{[^}]+}').findall(ip_content[0])
-                    if ip_dict_regx:
-                        ip_dict = ast.literal_eval(ip_dict_regx[0])
-                        ip_from_dict = ip_dict.get('cip')
-                        if ip_from_dict:
-                            public_ip = "%s    %s" % (ip_from_dict,ip_dict.get('cname'))
-            await self._lederouter.connection.async_run_command('rm getip1')
-            await self._lederouter.connection.async_run_command(
-                'wget -q -T 20 -b -O getip1 pv.sohu.com/cityjson?ie=utf-8')
-
-            if not public_ip:
-                ip_content = await self._lederouter.connection.async_run_command('cat getip2')
-                if ip_content:
-                    ip_regx = _IP_REGEX.findall(ip_content[0])
-                    if ip_regx:
-                        public_ip = ip_regx[0]
-            await self._lederouter.connection.async_run_command('rm getip2')
-            await self._lederouter.connection.async_run_command(
-                'wget -q -T 20 -b -O getip2 members.3322.org/dyndns/getip')
-
+            await self._lederouter.async_update_public_ip()
         except  Exception as e:
             _LOGGER.error(e)
-
-        if public_ip:
-            await self._lederouter.set_public_ip(public_ip)
-        else:
             await self._lederouter.set_public_ip("0.0.0.0")
 
     async def pub_data_mqtt(self):
@@ -200,31 +154,9 @@ class LedeSensor(Entity):
             _LOGGER.error(e)
 
     async def get_wireless_clients(self):
-        """Get dhcp clients."""
+        """Get wireless clients."""
         try:
-            connected_devices = await self.async_run_command_to_line(WIRELESS_CLIENTS_COMMAND)
-            if  not connected_devices:
-                await self._lederouter.set_client_number(0)
-                return
-
-            json_clients = json.loads(connected_devices)
-            mac_clients = json_clients["clients"].keys()
-            
-            dict_arp = dict()
-            arp_list = await self._lederouter.connection.async_run_command(
-                _ARP_LIST_COMMAND)
-
-            client_ip_list = []
-            for arp in arp_list:
-
-                for mac in mac_clients:
-                    if arp.find(mac) >=0 :
-                        ip_regx = _IP_REGEX.findall(arp)
-                        if not ip_regx:
-                            continue
-                        client_ip_list.append(ip_regx[0])
-
-            await self._lederouter.set_client_number(len(client_ip_list))
+            await self._lederouter.async_update_wireless_clients()
         except  Exception as e:
             _LOGGER.error(e)
 
@@ -309,6 +241,7 @@ class LedeSensor(Entity):
         except  Exception as e:
             self._connected = False
             await self._lederouter.set_public_ip("0.0.0.0")
+            self._lederouter.invalidate_public_ip()
             if self._lederouter.connect_failed:
                 await self._lederouter.set_device_state(0)
             _LOGGER.error(e)
@@ -1,28 +1,32 @@
 """Module for LedeWrt."""
+import base64
 import logging
 import json
-from homeassistant.util import dt as dt_util
+import zlib
 from .const import *
-
-from homeassistant.const import (
-    ATTR_NOW,
-    EVENT_TIME_CHANGED,
-)
+from .timer import IntervalTimer
 
 _LOGGER = logging.getLogger(__name__)
 
 class WrtMqttPub:
-    def __init__(self, hass, publish):
+    def __init__(self, hass, publish, per_router=False, compress=False,
+                 max_size=DEFAULT_PUB_MAX_SIZE, interval=DEFAULT_PUB_INTERVAL,
+                 align=False, jitter=0):
         self._hass = hass
         self._state_publish = False
         self._network_publish = False
+        self._per_router = per_router
+        self._compress = compress
+        self._max_size = max_size
         self._mqtt = hass.components.mqtt
-        self._last_pub_time = dt_util.utcnow()
         self._last_pub_states = {}
+        self._last_pub_network = {}
         self._router_state = {}
         self._network_state = {}
 
-        self._hass.bus.async_listen(EVENT_TIME_CHANGED,self._on_time_change)
+        self._pub_timer = IntervalTimer(hass, self._async_publish,
+            interval, align, jitter)
+        self._pub_timer.start()
 
         mqtt = hass.components.mqtt
         if mqtt:
@@ -47,64 +51,85 @@ class WrtMqttPub:
             network_states[NETWORK_STATE_DOWNLOAD] = states.pop(NETWORK_STATE_DOWNLOAD)
             network_states[NETWORK_STATE_UPLOAD] = states.pop(NETWORK_STATE_UPLOAD)
             
-            self._network_state[name] = json.dumps(network_states)
-            self._router_state[name] = json.dumps(states)
+            self._network_state[name] = network_states
+            self._router_state[name] = dict(states)
         except Exception as e:
             self._router_state = {}
             self._network_state = {}
             _LOGGER.error(e)
-    
-    async def _on_time_change(self, event):
-        try:
-            time_now = event.data.get(ATTR_NOW)
-            if not time_now:
-                return
 
-            time_diff = time_now - self._last_pub_time
-            if time_diff.total_seconds() < 60 :
-                return
+    def _get_delta(self, states, last_pub_states):
+        """Return the changed fields of every router, and mark them published."""
+        delta = {}
+        for name, fields in states.items():
+            last_fields = last_pub_states.setdefault(name, {})
+            changed = {}
+            for key, value in fields.items():
+                if key not in last_fields or last_fields[key] != value:
+                    changed[key] = value
+
+            if changed:
+                last_fields.update(changed)
+                delta[name] = changed
+
+        return delta
+
+    def _publish(self, topic, data):
+        payload = json.dumps(data)
+        if self._compress:
+            payload = base64.b64encode(
+                zlib.compress(payload.encode())).decode()
+        self._mqtt.publish(topic, payload)
+
+    def _publish_delta(self, topic, delta):
+        """Publish per router topics, or batches below the size limit."""
+        if self._per_router:
+            for name, fields in delta.items():
+                self._publish("%s/%s" % (topic, name), fields)
+            return
 
+        batch = {}
+        batch_size = 0
+        for name, fields in delta.items():
+            size = len(json.dumps({name: fields}))
+            if batch and batch_size + size > self._max_size:
+                self._publish(topic, batch)
+                batch = {}
+                batch_size = 0
+            if size > self._max_size:
+                _LOGGER.warning("%s states exceed the mqtt size limit", name)
+
+            batch[name] = fields
+            batch_size += size
+
+        if batch:
+            self._publish(topic, batch)
+    
+    async def _async_publish(self, time_now):
+        try:
             if self._state_publish == True:
-                _LOGGER.debug("AsusWrtMqtt : %s" % self._state_publish)
-                mqtt_publish = {}
-                for key,value in self._router_state.items():
-
-                    update_state = False
-                    if key in self._last_pub_states:
-                        if value != self._last_pub_states[key] :
-                            update_state = True  
-                    else :
-                        update_state = True
-
-                    if update_state :
-                        self._last_pub_states[key] = value
-                        mqtt_publish[key] = value
-
-                states =  json.dumps(mqtt_publish)
-                _LOGGER.debug("mqtt publish routers states")
-                _LOGGER.debug(states)
-                    
-                self._mqtt.publish(MQTT_STATES_UPDATE_TOPIC,states)
+                delta = self._get_delta(self._router_state, self._last_pub_states)
+                _LOGGER.debug("mqtt publish %s routers states", len(delta))
+                self._publish_delta(MQTT_STATES_UPDATE_TOPIC, delta)
 
             if self._network_publish == True:
-                
-                _LOGGER.debug("mqtt publish routers network information")      
-                self._mqtt.publish(MQTT_STATES_NETWORK_TOPIC,json.dumps(self._network_state))
+                delta = self._get_delta(self._network_state, self._last_pub_network)
+                _LOGGER.debug("mqtt publish %s routers network information", len(delta))
+                self._publish_delta(MQTT_STATES_NETWORK_TOPIC, delta)
 
             _LOGGER.debug(time_now)
-            self._last_pub_time = time_now
 
         except Exception as e:
             _LOGGER.error(e)
 
-    async def force_update_states(msg):
+    async def force_update_states(self, msg):
         """Handle new MQTT messages."""
         param = json.loads(msg.payload)
         update_list = param['list']
         _LOGGER.debug("mqtt force update device")
-        if not offline_list:
+        if not update_list:
             return
 
         for update_item in update_list:
-            if update_item in self._last_pub_states:
-                del self._last_pub_states[update_item]
\ No newline at end of file
+            self._last_pub_states.pop(update_item, None)
+            self._last_pub_network.pop(update_item, None)
\ No newline at end of file
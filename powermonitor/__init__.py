@@ -6,6 +6,8 @@ import voluptuous as vol
 from homeassistant.helpers import config_validation as cv
 from homeassistant.helpers.discovery import async_load_platform
 
+from .history import PowerHistory, DEFAULT_HISTORY_SIZE
+
 from homeassistant.const import (
     ATTR_ENTITY_ID,
     SERVICE_TURN_ON,
@@ -21,6 +23,14 @@ CONF_MAX_POWER = 'max_power'
 CONF_MAX_POWER_CONF = 'max_power_config'
 CONF_GROUPS = "groups"
 CONF_AUTO_RESTART = 'auto_restart'
+CONF_CHECK_INTERVAL = 'check_interval'
+CONF_CHECK_ALIGN = 'check_align'
+CONF_CHECK_JITTER = 'check_jitter'
+CONF_PRIORITIES = 'priorities'
+CONF_EXPECTED_LOADS = 'expected_loads'
+CONF_RESTORE_DELAY = 'restore_delay'
+CONF_HISTORY_SIZE = 'history_size'
+CONF_WINDOW = 'window'
 
 CONF_ID_LIST = 'id_list'
 
@@ -28,6 +38,8 @@ DOMAIN = "powermonitor"
 DATA_POWERMON = DOMAIN
 DEFAULT_POWER_KEY = "load_power"
 DEFAULT_MAX_POWER = 4800
+DEFAULT_CHECK_INTERVAL = 5
+DEFAULT_RESTORE_DELAY = 10
 
 GROUP_CONFIG = vol.Schema(
     {
@@ -36,6 +48,11 @@ GROUP_CONFIG = vol.Schema(
         vol.Optional(CONF_MAX_POWER ,default=DEFAULT_MAX_POWER): cv.positive_int,
         vol.Optional(CONF_MAX_POWER_CONF,default=""): cv.string,
         vol.Optional(CONF_AUTO_RESTART,default=True): cv.boolean,
+        vol.Optional(CONF_PRIORITIES, default={}): {cv.entity_id: vol.Coerce(int)},
+        vol.Optional(CONF_EXPECTED_LOADS, default={}): {cv.entity_id: vol.Coerce(float)},
+        vol.Optional(CONF_RESTORE_DELAY,default=DEFAULT_RESTORE_DELAY): cv.positive_int,
+        vol.Optional(CONF_HISTORY_SIZE,default=DEFAULT_HISTORY_SIZE): vol.All(
+            vol.Coerce(int), vol.Range(min=1)),
     }
 )
 
@@ -47,6 +64,9 @@ CONFIG_SCHEMA = vol.Schema(
                 vol.Required(CONF_GROUPS, default={}): vol.All(
                     cv.ensure_list,vol.All([GROUP_CONFIG]),
                 ),
+                vol.Optional(CONF_CHECK_INTERVAL,default=DEFAULT_CHECK_INTERVAL): cv.positive_int,
+                vol.Optional(CONF_CHECK_ALIGN,default=False): cv.boolean,
+                vol.Optional(CONF_CHECK_JITTER,default=0): cv.positive_int,
             }
         )
     },
@@ -57,6 +77,14 @@ CONFIG_SCHEMA = vol.Schema(
 SERVICE_TURN_ALL_ON = "turn_all_on"
 SERVICE_TURN_ALL_ON_SCHEMA = vol.Schema({vol.Required(CONF_ID_LIST): cv.string})
 
+SERVICE_POWER_STATS = "power_stats"
+SERVICE_POWER_STATS_SCHEMA = vol.Schema({
+    vol.Optional(CONF_GROUP_ID): cv.string,
+    vol.Optional(CONF_WINDOW): vol.All(vol.Coerce(int), vol.Range(min=1)),
+})
+
+EVENT_POWER_STATS = "powermonitor_power_stats"
+
 class PowerMonitor:
     """interface of a power monitor."""
 
@@ -67,6 +95,13 @@ class PowerMonitor:
         self._max_power = max_power
         self._max_power_conf = max_power_conf
         self._auto_restart = True
+        self._check_interval = DEFAULT_CHECK_INTERVAL
+        self._check_align = False
+        self._check_jitter = 0
+        self._priorities = {}
+        self._expected_loads = {}
+        self._restore_delay = DEFAULT_RESTORE_DELAY
+        self._history = PowerHistory()
 
     @property
     def group_id(self):
@@ -93,9 +128,57 @@ class PowerMonitor:
         """Return the name of the PowerMonito."""
         return self._auto_restart
 
+    @property
+    def check_interval(self):
+        """Return the interval of the restart check."""
+        return self._check_interval
+
+    @property
+    def check_align(self):
+        """Return if the restart check is aligned to the clock."""
+        return self._check_align
+
+    @property
+    def check_jitter(self):
+        """Return the max jitter of the restart check."""
+        return self._check_jitter
+
+    @property
+    def priorities(self):
+        """Return the restore priority of the devices."""
+        return self._priorities
+
+    @property
+    def expected_loads(self):
+        """Return the power the devices draw once on."""
+        return self._expected_loads
+
+    @property
+    def restore_delay(self):
+        """Return the delay before a device turned off is restored."""
+        return self._restore_delay
+
+    @property
+    def history(self):
+        """Return the power samples of the group."""
+        return self._history
+
     def set_auto_restart(self, auto_restart):
         self._auto_restart = auto_restart
 
+    def set_check_interval(self, interval, align=False, jitter=0):
+        self._check_interval = interval
+        self._check_align = align
+        self._check_jitter = jitter
+
+    def set_restore(self, priorities, expected_loads, restore_delay):
+        self._priorities = priorities
+        self._expected_loads = expected_loads
+        self._restore_delay = restore_delay
+
+    def set_history_size(self, size):
+        self._history = PowerHistory(size)
+
 
 async def async_setup(hass, config):
     """Set up the asusrouter component."""
@@ -117,6 +200,11 @@ async def async_setup(hass, config):
         )
         
         monitor.set_auto_restart(conf[CONF_AUTO_RESTART])
+        monitor.set_restore(conf[CONF_PRIORITIES], conf[CONF_EXPECTED_LOADS],
+            conf[CONF_RESTORE_DELAY])
+        monitor.set_history_size(conf[CONF_HISTORY_SIZE])
+        monitor.set_check_interval(config[DOMAIN][CONF_CHECK_INTERVAL],
+            config[DOMAIN][CONF_CHECK_ALIGN], config[DOMAIN][CONF_CHECK_JITTER])
         monitors.append(monitor)
 
     power_monitor['name'] = config[DOMAIN][CONF_NAME]
@@ -148,6 +236,23 @@ async def async_setup(hass, config):
     hass.services.async_register(
         DOMAIN, SERVICE_TURN_ALL_ON, _turn_all_on, schema=SERVICE_TURN_ALL_ON_SCHEMA
     )
+
+    async def _power_stats(call):
+        """Report the power statistics of the groups."""
+
+        group_id = call.data.get(CONF_GROUP_ID)
+        window = call.data.get(CONF_WINDOW)
+        report = {}
+        for monitor in monitors:
+            if group_id and monitor.group_id != group_id:
+                continue
+            report[monitor.group_id] = monitor.history.stats(window)
+
+        hass.bus.async_fire(EVENT_POWER_STATS, report)
+
+    hass.services.async_register(
+        DOMAIN, SERVICE_POWER_STATS, _power_stats, schema=SERVICE_POWER_STATS_SCHEMA
+    )
     
 
     return True
@@ -0,0 +1,59 @@
+"""Running power sum of a powermonitor group."""
+import logging
+import math
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class PowerAggregator:
+    """Keep the total power of a group, one device change at a time.
+
+    The members are indexed once, a state change only applies the
+    difference between the new and the last known power of its device.
+    """
+
+    def __init__(self):
+        """Init an empty group, call reset with the members."""
+        self._powers = {}
+        self._total = 0.0
+
+    def __contains__(self, device):
+        return device in self._powers
+
+    def __len__(self):
+        return len(self._powers)
+
+    @property
+    def total(self):
+        """Return the total power of the group."""
+        return max(self._total, 0.0)
+
+    @property
+    def members(self):
+        """Return the devices of the group."""
+        return list(self._powers)
+
+    def reset(self, devices):
+        """Index the members of the group, their power starts at 0."""
+        self._powers = dict.fromkeys(devices, 0.0)
+        self._total = 0.0
+
+    def update(self, device, power):
+        """Apply the power of a member, return the change of the total."""
+        old_power = self._powers.get(device)
+        if old_power is None:
+            return 0.0
+
+        power = max(power, 0.0)
+        delta = power - old_power
+        if not delta:
+            return 0.0
+
+        self._powers[device] = power
+        self._total += delta
+        return delta
+
+    def resum(self):
+        """Sum the powers again to drop the rounding drift of the deltas."""
+        self._total = math.fsum(self._powers.values())
+        return self._total
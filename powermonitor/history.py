@@ -0,0 +1,91 @@
+"""Power history of a powermonitor group."""
+import logging
+import math
+from array import array
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_HISTORY_SIZE = 720
+PERCENTILES = (50, 90, 95, 99)
+
+
+def percentile(ordered, percent):
+    """Return the percentile of sorted values, interpolating between ranks."""
+    if not ordered:
+        return 0.0
+
+    rank = (len(ordered) - 1) * percent / 100.0
+    low = math.floor(rank)
+    high = math.ceil(rank)
+    if low == high:
+        return ordered[low]
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+class PowerHistory:
+    """Fixed size ring buffer of power samples.
+
+    The samples are kept in a float array, the sum of the buffer is kept
+    up to date so the average of the whole window costs O(1).
+    """
+
+    def __init__(self, size=DEFAULT_HISTORY_SIZE):
+        """Init an empty history of size samples."""
+        self._samples = array('d', bytes(8 * size))
+        self._size = size
+        self._index = 0
+        self._count = 0
+        self._sum = 0.0
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def size(self):
+        """Return the number of samples kept."""
+        return self._size
+
+    def append(self, power):
+        """Add a sample, dropping the oldest one when full."""
+        if self._count == self._size:
+            self._sum -= self._samples[self._index]
+        else:
+            self._count += 1
+
+        self._samples[self._index] = power
+        self._sum += power
+        self._index = (self._index + 1) % self._size
+        if not self._index:
+            self._sum = math.fsum(self._samples[:self._count])
+
+    def values(self, window=None):
+        """Return the last window samples, oldest first."""
+        count = self._count if not window else min(window, self._count)
+        start = self._index - count
+        if start >= 0:
+            return self._samples[start:self._index]
+        return self._samples[start:] + self._samples[:self._index]
+
+    def average(self, window=None):
+        """Return the moving average of the last window samples."""
+        if not self._count:
+            return 0.0
+        if not window or window >= self._count:
+            return self._sum / self._count
+        return math.fsum(self.values(window)) / window
+
+    def stats(self, window=None):
+        """Return the average, peak and percentiles of the last window samples."""
+        values = self.values(window)
+        if not values:
+            return {'samples': 0}
+
+        ordered = sorted(values)
+        stats = {
+            'samples': len(values),
+            'average': round(self.average(window), 2),
+            'peak': round(ordered[-1], 2),
+        }
+        for percent in PERCENTILES:
+            stats['p%s' % percent] = round(percentile(ordered, percent), 2)
+        return stats
@@ -0,0 +1,129 @@
+"""Staggered power restoration for powermonitor."""
+import heapq
+import itertools
+import logging
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_PRIORITY = 0
+
+
+class RestoreScheduler:
+    """Devices waiting to be turned on again, ordered by due time.
+
+    Entries live in a min-heap, a rescheduled or cancelled device leaves
+    its old entry behind and it is skipped when popped. An admitted device
+    keeps its expected load pending until it reports on, is cancelled or
+    comes due again for a retry.
+    """
+
+    def __init__(self, priorities=None, expected_loads=None):
+        """Init the scheduler with the per device priority and load."""
+        self._priorities = priorities or {}
+        self._expected_loads = expected_loads or {}
+        self._learned_loads = {}
+        self._heap = []
+        self._entries = {}
+        self._counter = itertools.count()
+        self._restoring = {}
+        self._pending_load = 0.0
+
+    def __contains__(self, device):
+        return device in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def pending_load(self):
+        """Return the expected load of the devices being turned on."""
+        return max(self._pending_load, 0.0)
+
+    @property
+    def devices(self):
+        """Return the waiting devices by due time."""
+        return [entry[3] for entry in sorted(self._entries.values())]
+
+    def priority(self, device):
+        """Return the priority of a device, higher is restored first."""
+        return self._priorities.get(device, DEFAULT_PRIORITY)
+
+    def expected_load(self, device):
+        """Return the power a device draws once it is on."""
+        load = self._expected_loads.get(device)
+        if load is None:
+            load = self._learned_loads.get(device, 0.0)
+        return load
+
+    def learn_load(self, device, power):
+        """Remember the power a device drew while it was on."""
+        if power > 0.0:
+            self._learned_loads[device] = power
+
+    def schedule(self, device, due):
+        """Restore a device at due, replacing its previous entry."""
+        entry = [due, -self.priority(device), next(self._counter), device]
+        self._entries[device] = entry
+        heapq.heappush(self._heap, entry)
+
+    def cancel(self, device):
+        """Forget a device."""
+        self._entries.pop(device, None)
+        self._release(device)
+
+    def clear(self):
+        """Forget every device."""
+        self._entries.clear()
+        self._heap = []
+        self._restoring.clear()
+        self._pending_load = 0.0
+
+    def next_due(self):
+        """Return the first waiting device, or an empty string."""
+        self._drop_stale()
+        if not self._heap:
+            return ""
+        return self._heap[0][3]
+
+    def pop_due(self, now, headroom):
+        """Return the due devices that fit in the headroom.
+
+        The headroom is the budget left by the measured power, the load
+        still pending for admitted devices is taken out here. The due
+        devices are admitted by priority, then by due time; the ones that
+        do not fit stay in the queue for the next tick.
+        """
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            entry = heapq.heappop(self._heap)
+            if self._entries.get(entry[3]) is entry:
+                self._release(entry[3])
+                due.append(entry)
+
+        headroom -= self.pending_load
+        admitted = []
+        for entry in sorted(due, key=lambda entry: entry[1:]):
+            device = entry[3]
+            load = self.expected_load(device)
+            if load > headroom:
+                heapq.heappush(self._heap, entry)
+                continue
+
+            headroom -= load
+            del self._entries[device]
+            self._restoring[device] = load
+            self._pending_load += load
+            admitted.append(device)
+
+        return admitted
+
+    def _release(self, device):
+        load = self._restoring.pop(device, None)
+        if load is not None:
+            self._pending_load -= load
+            if not self._restoring:
+                self._pending_load = 0.0
+
+    def _drop_stale(self):
+        while self._heap and self._entries.get(self._heap[0][3]) is not self._heap[0]:
+            heapq.heappop(self._heap)
@@ -1,20 +1,20 @@
 """Asusrouter status sensors."""
 import logging
 import math
-from datetime import datetime
+from datetime import datetime, timedelta
 from homeassistant.helpers.entity import Entity
 from homeassistant.util import dt as dt_util
 from . import PowerMonitor
 from . import DATA_POWERMON
+from .aggregator import PowerAggregator
+from .scheduler import RestoreScheduler
+from .timer import IntervalTimer
 
 from homeassistant.const import (
-    ATTR_NOW,
-
     ATTR_ENTITY_ID,
     SERVICE_TURN_ON,
 
     EVENT_STATE_CHANGED,
-    EVENT_TIME_CHANGED,
 )
 
 _LOGGER = logging.getLogger(__name__)
@@ -39,34 +39,47 @@ class PowerSensor(Entity):
         self._max_power = monitor.max_power
         self._max_power_conf = monitor.max_power_conf
         self._auto_restart = monitor.auto_restart
-        self._last_power_off = ""
         self._ready_to_power_on = ""
         self._hass = hass
         self._current_power = 0.0
-
-        self._last_power_on_stamp = None
+        self._restore_delay = timedelta(seconds=monitor.restore_delay)
+        self._scheduler = RestoreScheduler(monitor.priorities, monitor.expected_loads)
 
         self._hass.bus.async_listen(EVENT_STATE_CHANGED,self._on_state_change)
-        self._hass.bus.async_listen(EVENT_TIME_CHANGED,self._on_time_change)
+        self._check_timer = IntervalTimer(hass, self._on_check_time,
+            monitor.check_interval, monitor.check_align, monitor.check_jitter)
+        self._check_timer.start()
 
-        self._devices_power_dict = {}
-        self._state_off_dict = {}
+        self._aggregator = PowerAggregator()
+        self._group_members = None
+        self._history = monitor.history
 
     @property
     def device_to_power_on(self):
         """Return the device to turn on power."""
         return self._ready_to_power_on
 
-    def get_device_power(self, device):
-        """Fetch device power."""
+    @property
+    def group_id(self):
+        """Return the group of the devices."""
+        return self._group_id
+
+    @property
+    def power_stats(self):
+        """Return the statistics of the power history."""
+        return self._history.stats()
+
+    @property
+    def devices_to_restore(self):
+        """Return the devices waiting to be turned on again."""
+        return self._scheduler.devices
+
+    def get_state_power(self, item):
+        """Return the power of a device state."""
         try:
-          item = self._hass.states.get(device)
           if not item:
             return 0.0
 
-          if item.state == 'off' :
-            self._last_power_off = device
-
           power = item.attributes.get(self._power_key)
           if not power:
               return 0.0
@@ -76,6 +89,10 @@ class PowerSensor(Entity):
             _LOGGER.error(e)
             return 0.0
 
+    def get_device_power(self, device):
+        """Fetch device power."""
+        return self.get_state_power(self._hass.states.get(device))
+
     def get_max_power(self):
         """get max power."""
         if self._max_power_conf == "":
@@ -86,57 +103,65 @@ class PowerSensor(Entity):
             return self._max_power
           return float(item.state)
 
-    def update_current_power(self):
-
-        self._current_power = 0.0
+    def apply_device_state(self, device, item):
+        """Apply the state of one member to the running sum."""
+        power = self.get_state_power(item)
+        self._aggregator.update(device, power)
+        self._current_power = self._aggregator.total
 
-        for device in self._devices_power_dict.keys():
-            power = self.get_device_power(device)
-            if power > 0.0:
-                self._current_power += power
+        if item and item.state == 'on':
+            self._scheduler.learn_load(device, power)
 
-            self._devices_power_dict[device] = power
+    def load_group(self, id_list):
+        """Index the members of the group and sum their power once."""
+        self._group_members = list(id_list or [])
+        self._aggregator.reset(self._group_members)
+        _LOGGER.debug(" Get group devices : %s", str(self._group_members))
+        self.update_current_power()
 
-    def is_ready_to_power_on(self):
+        for device in self._scheduler.devices:
+            if device not in self._aggregator:
+                self._scheduler.cancel(device)
 
-        if not self._last_power_on_stamp:
-            return True
+        if self._auto_restart:
+            due = dt_util.utcnow() + self._restore_delay
+            for device in self._group_members:
+                if self._hass.states.is_state(device, 'off') and device not in self._scheduler:
+                    self._scheduler.schedule(device, due)
 
-#        if self.get_max_power() - self._current_power >500 :
-#            return True
+    def update_current_power(self):
+        """Read every member again, the state changes keep the sum after."""
+        for device in self._aggregator.members:
+            self._aggregator.update(device, self.get_device_power(device))
+        self._current_power = self._aggregator.resum()
 
-        time_diff = dt_util.utcnow() - self._last_power_on_stamp
-        if time_diff.total_seconds() > 300:
-            return True
+    async def restore_devices(self, time_now):
+        """Turn on every due device the power headroom allows."""
+        devices = self._scheduler.pop_due(time_now,
+            self.get_max_power() - self._current_power)
+        if not devices:
+            return
 
-        return False
+        _LOGGER.debug(" Turn on the devices : %s", devices)
+        for device in devices:
+            self._scheduler.schedule(device, time_now + self._restore_delay)
 
-    async def power_on_switch(self,switch_to_power_on):
-   
-        if self.is_ready_to_power_on():
-            await self._hass.services.async_call("switch", 
-                SERVICE_TURN_ON, {ATTR_ENTITY_ID: switch_to_power_on})
-            self._last_power_on_stamp = dt_util.utcnow()
+        await self._hass.services.async_call("switch",
+            SERVICE_TURN_ON, {ATTR_ENTITY_ID: devices})
 
     async def get_power_count(self):
  
-        self._last_power_off = ""
         self._ready_to_power_on = ""
 
         try:
-            if not self._devices_power_dict :
-                self._devices_power_dict = dict.fromkeys(
+            if self._group_members is None:
+                self.load_group(
                     self._hass.states.get(self._group_id).attributes.get('entity_id'))
-                _LOGGER.debug(" Get group devices : %s", str(self._devices_power_dict))
 
-            self.update_current_power()
+            self._history.append(self._current_power)
 
             if self._current_power < self.get_max_power():
-                self._ready_to_power_on = self._last_power_off
-
-                if self._auto_restart and self._ready_to_power_on:
-                    _LOGGER.debug(" Turn on the device : %s", self._ready_to_power_on)
-                    await self.power_on_switch(self._ready_to_power_on)
+                self._ready_to_power_on = self._scheduler.next_due()
 
             return self._current_power
                     
@@ -153,44 +178,39 @@ class PowerSensor(Entity):
 
             triger_id = event.data.get("entity_id")
 
-            if triger_id == self._group_id and state.state == "off":
-                self._state_off_dict.clear()
-            
-            if triger_id not in self._devices_power_dict.keys():
+            if triger_id == self._group_id:
+                if state.state == "off":
+                    self._scheduler.clear()
+
+                id_list = list(state.attributes.get('entity_id') or [])
+                if self._group_members is not None and id_list != self._group_members:
+                    self.load_group(id_list)
                 return
 
-            old_state = event.data.get("old_state")
-            if old_state and old_state.state == "on" and state.state == "off":
-                _LOGGER.debug("devices %s states change to %s", triger_id, state.state)
-                self._state_off_dict[triger_id] = dt_util.utcnow()
+            if triger_id not in self._aggregator:
                 return
 
-            if state.state == "on":
+            self.apply_device_state(triger_id, state)
 
-                self.update_current_power()
+            old_state = event.data.get("old_state")
+            old = old_state.state if old_state else None
+            if state.state == "off" and old != "off":
+                if old == "on" or self._auto_restart:
+                    _LOGGER.debug("devices %s states change to %s", triger_id, state.state)
+                    self._scheduler.cancel(triger_id)
+                    self._scheduler.schedule(triger_id,
+                        dt_util.utcnow() + self._restore_delay)
+                return
 
-                if triger_id in self._state_off_dict.keys():
-                    del self._state_off_dict[triger_id]
+            if state.state == "on":
+                self._scheduler.cancel(triger_id)
 
         except Exception as e:
             _LOGGER.error(e)
 
-    async def _on_time_change(self, event):
+    async def _on_check_time(self, time_now):
         try:
-            time_now = event.data.get(ATTR_NOW)
-            if not time_now:
-                return
-
-            for device, stamp in self._state_off_dict.items():
-                time_diff = time_now - stamp
-                _LOGGER.debug("state since last change to off")
-                _LOGGER.debug(time_diff)
-                if time_diff.total_seconds() > 10:
-                    if self._current_power < self.get_max_power():
-                        await self._hass.services.async_call("switch", 
-                            SERVICE_TURN_ON, {ATTR_ENTITY_ID: device})
-                        self._state_off_dict[device] = time_now
-                        return
+            await self.restore_devices(time_now)
 
         except Exception as e:
             _LOGGER.error(e)
@@ -204,6 +224,8 @@ class PowerMonitorSensor(Entity):
         self._name = name
         self._state = None
         self._ready_to_power_on = []
+        self._restore_queue = []
+        self._power_stats = {}
         self._monitor_list = []
         self._hass = hass
 
@@ -224,7 +246,9 @@ class PowerMonitorSensor(Entity):
     def device_state_attributes(self):
         """Return the state attributes."""	
         return {
-            'ready_to_power_on': self._ready_to_power_on if self._ready_to_power_on else ""
+            'ready_to_power_on': self._ready_to_power_on if self._ready_to_power_on else "",
+            'restore_queue': self._restore_queue,
+            'power_stats': self._power_stats,
         }
 
     @property
@@ -236,6 +260,7 @@ class PowerMonitorSensor(Entity):
         """Fetch status from router."""
         try:
             self._ready_to_power_on = []
+            self._restore_queue = []
 
             power_count = 0.0
 
@@ -244,6 +269,8 @@ class PowerMonitorSensor(Entity):
 
                 if monitor.device_to_power_on :
                     self._ready_to_power_on.append(monitor.device_to_power_on)
+                self._restore_queue.extend(monitor.devices_to_restore)
+                self._power_stats[monitor.group_id] = monitor.power_stats
 
             self._state = "%.2f" % (power_count)
         
@@ -1,10 +1,13 @@
 """Support for SwitchMonitor devices."""
+import asyncio
 import logging
 import voluptuous as vol
 
 from homeassistant.helpers import config_validation as cv
 from homeassistant.helpers.discovery import async_load_platform
 
+from .tracker import OffStateTracker
+
 from homeassistant.const import (
     ATTR_ENTITY_ID,
     SERVICE_TURN_OFF,
@@ -21,9 +24,17 @@ CONF_ID_DEVICE = 'id'
 CONF_MIN_FUR_CHECK = 'min_fur_check'
 CONF_FUR_SWITCH_NAME = 'fur_switch_name'
 CONF_INTERVALE = 'interval'
+CONF_ALIGN = 'align'
+CONF_JITTER = 'jitter'
+CONF_MAX_PARALLEL = 'max_parallel'
+CONF_RATE_LIMIT = 'rate_limit'
 
 DOMAIN = "switchmonitor"
 DATA_SWITCHMON = DOMAIN
+DEFAULT_MAX_PARALLEL = 8
+DEFAULT_RATE_LIMIT = 10
+
+EVENT_SERVICE_RESULT = "switchmonitor_service_result"
 
 CONFIG_SCHEMA = vol.Schema(
     {
@@ -34,7 +45,11 @@ CONFIG_SCHEMA = vol.Schema(
                 vol.Optional(CONF_CONFIRM_CHECK,default=5): cv.positive_int,
                 vol.Optional(CONF_MIN_FUR_CHECK,default=3): cv.positive_int,
                 vol.Optional(CONF_INTERVALE,default=300): cv.positive_int,
+                vol.Optional(CONF_ALIGN,default=False): cv.boolean,
+                vol.Optional(CONF_JITTER,default=0): cv.positive_int,
                 vol.Optional(CONF_FUR_SWITCH_NAME,default=""): cv.string,
+                vol.Optional(CONF_MAX_PARALLEL,default=DEFAULT_MAX_PARALLEL): cv.positive_int,
+                vol.Optional(CONF_RATE_LIMIT,default=DEFAULT_RATE_LIMIT): cv.positive_int,
             }
         )
     },
@@ -42,7 +57,17 @@ CONFIG_SCHEMA = vol.Schema(
 )
 
 SERVICE_TURN_ALL_ON = "turn_all_on"
-SERVICE_TURN_ALL_ON_SCHEMA = vol.Schema({vol.Required(CONF_ID_LIST): cv.string})
+
+
+def id_list_validator(value):
+    """Accept a list, a comma separated string or a stringified list."""
+    if isinstance(value, str):
+        value = [item.strip(' \'"') for item in value.strip('[]').split(',')]
+        value = [item for item in value if item]
+    return cv.entity_ids(value)
+
+
+SERVICE_TURN_ALL_ON_SCHEMA = vol.Schema({vol.Required(CONF_ID_LIST): id_list_validator})
 
 SERVICE_TURN_ON_DEVICE = "turn_on_device"
 SERVICE_TURN_ON_DEVICE_SCHEMA = vol.Schema({vol.Required(CONF_ID_DEVICE): cv.string})
@@ -59,7 +84,13 @@ class SwitchMonitor:
         self._further_switch_name = further_switch_name
         self._name = conf_name
         self._interval = None
-        self._state_off_dict = {}
+        self._align = False
+        self._jitter = 0
+        self._max_parallel = DEFAULT_MAX_PARALLEL
+        self._rate_limit = DEFAULT_RATE_LIMIT
+        self._tracker = OffStateTracker(confirm_check)
+        self._members = None
+        self._id_index = {}
         self._turn_on_count_dict = {}
 
     @property
@@ -82,13 +113,44 @@ class SwitchMonitor:
         """Return the interval"""
         return self._interval
 
+    @property
+    def check_align(self):
+        """Return if the check is aligned to the clock"""
+        return self._align
+
+    @property
+    def check_jitter(self):
+        """Return the max jitter of the check"""
+        return self._jitter
+
+    @property
+    def members(self):
+        """Return the switches of the group, None before they are loaded"""
+        return self._members
+
     @property
     def further_switch_name(self):
         """Return the further switch name of switch"""
         return self._further_switch_name
 
-    def set_auto_check_interval(self, interval):
+    @property
+    def max_parallel(self):
+        """Return the max number of switches resumed at once"""
+        return self._max_parallel
+
+    @property
+    def rate_limit(self):
+        """Return the max number of switches resumed per second"""
+        return self._rate_limit
+
+    def set_resume_limits(self, max_parallel, rate_limit):
+        self._max_parallel = max_parallel
+        self._rate_limit = rate_limit
+
+    def set_auto_check_interval(self, interval, align=False, jitter=0):
         self._interval = interval
+        self._align = align
+        self._jitter = jitter
 
     def need_further_operation(self, item):
         if not item:
@@ -105,26 +167,48 @@ class SwitchMonitor:
 
         return False
 
-    async def update_turn_on_count_dict(self, new_off_dict):
-        if not self._turn_on_count_dict:
-            return
-        try:
-            new_dict = dict()
-            for switch in self._turn_on_count_dict:
-                if switch in new_off_dict:
-                    new_dict[switch] = self._turn_on_count_dict[switch]
-
-            self._turn_on_count_dict = new_dict
-
-        except Exception as e:
-            _LOGGER.error(e)
+    def is_member(self, item):
+        return item in self._tracker
+
+    def load_members(self, id_list, hass_states):
+        """Track the switches of the group from their current state."""
+        self._members = list(id_list or [])
+        states = dict()
+        for device in self._members:
+            item = hass_states.get(device)
+            states[device] = item.state if item else None
+
+        self._tracker.set_members(states)
+        self._id_index = self.build_id_index(self._members)
+
+    @staticmethod
+    def build_id_index(id_list):
+        """Index the switches by the first two parts of their object id."""
+        id_index = dict()
+        for device in id_list:
+            dev_id = device.split('.', 1)[-1].split('_')
+            for part in dev_id[:2]:
+                id_index.setdefault(part, device)
+        return id_index
+
+    def update_member_state(self, item, new_state):
+        """Apply the state change of a switch."""
+        self._tracker.update(item, new_state.state if new_state else None)
+
+    def check_state_off(self):
+        """Count one more check, return the switches ready to resume."""
+        if self._turn_on_count_dict:
+            self._turn_on_count_dict = {switch: count
+                for switch, count in self._turn_on_count_dict.items()
+                if self._tracker.is_off(switch)}
+
+        return self._tracker.check()
 
     async def remove_from_state_off_dict(self, item):
         if not item:
             return
         try:
-            if item in self._state_off_dict:
-                self._state_off_dict.pop(item)
+            self._tracker.rearm(item)
 
             if item in self._turn_on_count_dict:
                 self._turn_on_count_dict[item] += 1
@@ -146,50 +230,20 @@ class SwitchMonitor:
         except Exception as e:
             _LOGGER.error(e)
 
-    async def update_state_off_dict(self, current_off_dict):
-        ready_to_turn_on = []
-        await self.update_turn_on_count_dict(current_off_dict)
-        try:
-            new_off_dict = dict()
-
-            if self._state_off_dict:
-                for switch in self._state_off_dict:
-                    if switch in current_off_dict:
-                        new_off_dict[switch] = self._state_off_dict[switch] + 1
-                        current_off_dict.pop(switch)
-
-                        if new_off_dict[switch] > self._confirm_check:
-                            ready_to_turn_on.append(switch)
-
-            self._state_off_dict = new_off_dict
-
-            if current_off_dict:
-                self._state_off_dict.update(current_off_dict)
-
-            return ready_to_turn_on
-
-        except Exception as e:
-            _LOGGER.error(e)
-            return []
-
     def get_device_by_id(self, id, hass_states):
         if not id:
             return None
         try:
+            if self._members is None:
+                self.load_members(hass_states.get(self._group_id).attributes.get('entity_id'),
+                    hass_states)
 
-            id_list = hass_states.get(self._group_id).attributes.get('entity_id')
-            for device in id_list:
-                dev_name = device.split('.')
-                dev_id = dev_name[1].split('_')
-                if dev_id[0] == id or dev_id[1] == id:
-                    return device
+            return self._id_index.get(id)
 
-            return None
-            
         except Exception as e:
             _LOGGER.error(e)
 
-    async def resume_device(self, item, hass, operator):
+    async def resume_device(self, item, hass, operator, blocking=False):
         """resume the device network."""
         if not item:
             return
@@ -198,15 +252,53 @@ class SwitchMonitor:
             fur_switch = hass.states.get(item).attributes.get(self.further_switch_name)
             if(fur_switch):
                 _LOGGER.warning("%s turn off device %s" % (operator, fur_switch))
-                await hass.services.async_call("switch", SERVICE_TURN_OFF, {ATTR_ENTITY_ID: fur_switch})
+                await hass.services.async_call("switch", SERVICE_TURN_OFF,
+                    {ATTR_ENTITY_ID: fur_switch}, blocking=blocking)
             else:
                 _LOGGER.warning("miss device further infomation %s" % (fur_switch))
             await self.remove_turn_count_dict(item)
         else:
             _LOGGER.warning("%s turn on device %s" % (operator, item))
-            await hass.services.async_call("switch", SERVICE_TURN_ON, {ATTR_ENTITY_ID: item})
+            await hass.services.async_call("switch", SERVICE_TURN_ON,
+                {ATTR_ENTITY_ID: item}, blocking=blocking)
             await self.remove_from_state_off_dict(item)
 
+    async def resume_devices(self, items, hass, operator):
+        """Resume the devices at once, under the parallel cap and the rate limit."""
+        loop = hass.loop
+        semaphore = asyncio.Semaphore(self._max_parallel)
+        interval = 1.0 / self._rate_limit if self._rate_limit else 0
+        next_slot = loop.time()
+        report = {"service": SERVICE_TURN_ALL_ON, "success": [], "failed": {}}
+
+        async def _resume_one(item):
+            nonlocal next_slot
+            async with semaphore:
+                if interval:
+                    now = loop.time()
+                    slot = max(next_slot, now)
+                    next_slot = slot + interval
+                    if slot > now:
+                        await asyncio.sleep(slot - now)
+
+                try:
+                    await self.resume_device(item, hass, operator, blocking=True)
+                    report["success"].append(item)
+                except Exception as e:
+                    report["failed"][item] = str(e)
+                    _LOGGER.error(e)
+
+        items = list(dict.fromkeys(items))
+        if items:
+            await asyncio.gather(*[_resume_one(item) for item in items])
+
+        if report["failed"]:
+            _LOGGER.warning("%s failed on %s of %s switches" % (SERVICE_TURN_ALL_ON,
+                len(report["failed"]), len(items)))
+
+        hass.bus.async_fire(EVENT_SERVICE_RESULT, report)
+        return report
+
 async def async_setup(hass, config):
     """Set up the asusrouter component."""
 
@@ -223,7 +315,10 @@ async def async_setup(hass, config):
             conf[CONF_FUR_SWITCH_NAME],
         )
 
-        hass.data[DATA_SWITCHMON].set_auto_check_interval(conf[CONF_INTERVALE])
+        hass.data[DATA_SWITCHMON].set_auto_check_interval(conf[CONF_INTERVALE],
+            conf[CONF_ALIGN], conf[CONF_JITTER])
+        hass.data[DATA_SWITCHMON].set_resume_limits(conf[CONF_MAX_PARALLEL],
+            conf[CONF_RATE_LIMIT])
 
     hass.async_create_task(
         async_load_platform(hass, "sensor", DOMAIN, {}, config)
@@ -237,11 +332,8 @@ async def async_setup(hass, config):
 
             id_list = call.data[CONF_ID_LIST]
             if id_list:
-                turn_list = id_list.strip('[]').split(',')
-                for item in turn_list:
-                    item = item.strip(' \'')
-                    _LOGGER.debug("SwitchMonitorSensor-----------turn on devices: %s", item)
-                    await device.resume_device(item, hass,"SwitchMonitor")
+                _LOGGER.debug("SwitchMonitorSensor-----------turn on devices: %s", id_list)
+                await device.resume_devices(id_list, hass, "SwitchMonitor")
 
         except Exception as e:
             _LOGGER.error(e)
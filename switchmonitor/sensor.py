@@ -5,14 +5,12 @@ from datetime import datetime
 from homeassistant.helpers.entity import Entity
 from . import SwitchMonitor
 from . import DATA_SWITCHMON
+from .timer import IntervalTimer
 
 from homeassistant.const import (
-    ATTR_NOW,
-
     ATTR_ENTITY_ID,
     SERVICE_TURN_ON,
-
-    EVENT_TIME_CHANGED,
+    EVENT_STATE_CHANGED,
 )
 
 _LOGGER = logging.getLogger(__name__)
@@ -34,12 +32,18 @@ class SwitchMonitorSensor(Entity):
         self._monitor = hass.data[DATA_SWITCHMON]
         self._name = self._monitor.name
         self._check_confirm = []
+        self._state = None
         self._hass = hass
 
-        self._last_trigger_stamp = None
+        self._hass.bus.async_listen(EVENT_STATE_CHANGED, self._on_state_change)
+
+        self._check_timer = None
 
         if self._monitor.check_interval > 0 :
-            self._hass.bus.async_listen(EVENT_TIME_CHANGED,self._on_time_change)
+            self._check_timer = IntervalTimer(hass, self._on_check_time,
+                self._monitor.check_interval, self._monitor.check_align,
+                self._monitor.check_jitter)
+            self._check_timer.start()
 
     @property
     def name(self):
@@ -58,33 +62,35 @@ class SwitchMonitorSensor(Entity):
             'state_off_list': self._check_confirm if self._check_confirm else "",
         }
 
-    def get_turn_off_list(self,id_list):
-        """Fetch trun off switch."""
-        turn_off_dict = dict()
+    async def _on_state_change(self, event):
         try:
-            for device in id_list:
-                item = self._hass.states.get(device)
-                if not item:
-                    continue
-                if item.state == 'unavailable':
-                    continue
-                if item.state != 'on' :
-                    turn_off_dict[device] = 1
-            return turn_off_dict
-        except  Exception as e:
+            triger_id = event.data.get("entity_id")
+            state = event.data.get("new_state")
+
+            if triger_id == self._monitor.group_id:
+                if not state or self._monitor.members is None:
+                    return
+
+                id_list = list(state.attributes.get('entity_id') or [])
+                if id_list != self._monitor.members:
+                    self._monitor.load_members(id_list, self._hass.states)
+                return
+
+            if self._monitor.is_member(triger_id):
+                self._monitor.update_member_state(triger_id, state)
+
+        except Exception as e:
             _LOGGER.error(e)
-            return dict()
 
     async def async_update(self):
         """Fetch status from router."""
 
         try:
-            ready_to_turn_on = []
+            if self._monitor.members is None:
+                self._monitor.load_members(self._hass.states.get(
+                    self._monitor.group_id).attributes.get('entity_id'), self._hass.states)
 
-            id_list = self._hass.states.get(self._monitor.group_id).attributes.get('entity_id')
-            current_off_dict = self.get_turn_off_list(id_list)
-           
-            self._check_confirm =  await self._monitor.update_state_off_dict(current_off_dict)
+            self._check_confirm = self._monitor.check_state_off()
 
             if self._check_confirm:
                 self._state = "checked"
@@ -101,24 +107,10 @@ class SwitchMonitorSensor(Entity):
             return
         
         await self._hass.services.async_call(DATA_SWITCHMON, 
-                        "turn_all_on", {"id_list": str(self._check_confirm)})
+                        "turn_all_on", {"id_list": list(self._check_confirm)})
 
-    async def _on_time_change(self, event):
+    async def _on_check_time(self, time_now):
         try:
-
-            time_now = event.data.get(ATTR_NOW)
-            if not time_now:
-                return
-
-            if not self._last_trigger_stamp :
-                self._last_trigger_stamp = time_now
-                return
-               
-            time_diff = time_now - self._last_trigger_stamp
-            if time_diff.total_seconds() < self._monitor.check_interval:
-                return
-
-            self._last_trigger_stamp = time_now
             _LOGGER.debug("SwitchMonitorSensor-----------auto_check_state : %s", time_now.strftime("%H:%M:%S"))
 
             await self.auto_resume_state()
@@ -0,0 +1,87 @@
+"""Off state tracking for switchmonitor."""
+import logging
+from collections import OrderedDict
+
+_LOGGER = logging.getLogger(__name__)
+
+STATE_ON = 'on'
+STATE_UNAVAILABLE = 'unavailable'
+
+
+def is_off_state(state):
+    """Return if a state counts as off, unavailable switches are not checked."""
+    return state is not None and state not in (STATE_ON, STATE_UNAVAILABLE)
+
+
+class OffStateTracker:
+    """Count the consecutive checks each member of a group stayed off.
+
+    The state changes of the members are applied one at a time, a switch
+    only remembers the check it was first seen off at. The switches wait
+    in the order they turned off, so a check only moves the ones whose
+    count passed confirm_check to the ready set.
+    """
+
+    def __init__(self, confirm_check):
+        """Init an empty tracker."""
+        self._confirm_check = confirm_check
+        self._members = set()
+        self._waiting = OrderedDict()
+        self._ready = OrderedDict()
+        self._check = 0
+
+    def __contains__(self, device):
+        return device in self._members
+
+    @property
+    def ready(self):
+        """Return the switches off for more than confirm_check checks."""
+        return list(self._ready)
+
+    def is_off(self, device):
+        """Return if a switch is off."""
+        return device in self._waiting or device in self._ready
+
+    def set_members(self, states):
+        """Track the switches of the group from their state strings.
+
+        The switches staying in the group keep their count.
+        """
+        self._members = set(states)
+        for tracked in (self._waiting, self._ready):
+            for device in [device for device in tracked if device not in self._members]:
+                del tracked[device]
+
+        for device, state in states.items():
+            self.update(device, state)
+
+    def update(self, device, state):
+        """Apply the new state of a switch."""
+        if device not in self._members:
+            return
+
+        if not is_off_state(state):
+            self._waiting.pop(device, None)
+            self._ready.pop(device, None)
+        elif not self.is_off(device):
+            self._waiting[device] = self._check + 1
+
+    def rearm(self, device):
+        """Count a switch that is still off from the next check again."""
+        if not self.is_off(device):
+            return
+        self._ready.pop(device, None)
+        self._waiting.pop(device, None)
+        self._waiting[device] = self._check + 1
+
+    def check(self):
+        """Count one more check, return the ready switches."""
+        self._check += 1
+        while self._waiting:
+            device, since = next(iter(self._waiting.items()))
+            if self._check - since + 1 <= self._confirm_check:
+                break
+            del self._waiting[device]
+            self._ready[device] = since
+
+        return self.ready
@@ -1,4 +1,5 @@
 """Support for Xiaomi Gateways."""
+import asyncio
 from datetime import timedelta
 import logging
 
@@ -135,7 +136,7 @@ def setup(hass, config):
     discovery.listen(hass, SERVICE_XIAOMI_GW, xiaomi_gw_discovered)
 
     xiaomi = hass.data[PY_XIAOMI_GATEWAY] = XiaomiGatewayDiscovery(
-        hass.add_job, gateways, interface
+        gateways, interface, hass.loop
     )
 
     _LOGGER.debug("Expecting %s gateways", len(gateways))
@@ -148,12 +149,13 @@ def setup(hass, config):
     if not xiaomi.gateways:
         _LOGGER.error("No gateway discovered")
         return False
-    xiaomi.listen()
+    asyncio.run_coroutine_threadsafe(xiaomi.async_listen(hass.loop), hass.loop).result()
     _LOGGER.debug("Gateways discovered. Listening for broadcasts")
 
     for component in ["binary_sensor", "sensor", "switch", "light", "cover", "lock"]:
         discovery.load_platform(hass, component, DOMAIN, {}, config)
 
+    @callback
     def stop_xiaomi(event):
         """Stop Xiaomi Socket."""
         _LOGGER.info("Shutting down Xiaomi Hub")
@@ -248,7 +250,16 @@ class XiaomiDevice(Entity):
             self._unique_id = f"{self._type}{self._sid}"
 
     def _add_push_data_job(self, *args):
-        self.hass.add_job(self.push_data, *args)
+        """Push on the spot from the loop, hop to it from other threads."""
+        try:
+            in_loop = asyncio.get_running_loop() is self.hass.loop
+        except RuntimeError:
+            in_loop = False
+
+        if in_loop:
+            self.push_data(*args)
+        else:
+            self.hass.add_job(self.push_data, *args)
 
     async def async_added_to_hass(self):
         """Start unavailability tracking."""
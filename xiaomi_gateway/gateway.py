@@ -1,17 +1,20 @@
 """Library to handle connection with Xiaomi Gateway"""
+import asyncio
 import socket
 import json
 import logging
 import platform
 import struct
 from collections import defaultdict
-from threading import Thread
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from cryptography.hazmat.backends import default_backend
 
 _LOGGER = logging.getLogger(__name__)
 
 DEFAULT_DISCOVERY_RETRIES = 4
+DEFAULT_CMD_TIMEOUT = 5
+DEFAULT_CMD_RETRIES = 1
+DEFAULT_MAX_IN_FLIGHT = 8
 
 GATEWAY_MODELS = ['gateway', 'gateway.v3', 'acpartner.v3']
 SOCKET_BUFSIZE = 4096
@@ -48,20 +51,147 @@ def create_mcast_socket(interface, port):
     return sock
 
 
+class XiaomiMulticastProtocol(asyncio.DatagramProtocol):
+    """Hand the multicast datagrams to the discovery on the event loop."""
+
+    def __init__(self, discovery):
+        self._discovery = discovery
+
+    def datagram_received(self, data, addr):
+        self._discovery.handle_message(data, addr[0])
+
+    def error_received(self, exc):
+        _LOGGER.error('Multicast socket error: %s', exc)
+
+    def connection_lost(self, exc):
+        _LOGGER.info('Listener stopped')
+
+
+def _sid_key(sid):
+    """Return the sid a response is matched by, the gateway may pad it with zeros."""
+    if sid is None:
+        return None
+    return str(sid).lower().lstrip('0')
+
+
+class GatewayTransport(asyncio.DatagramProtocol):
+    """Persistent UDP endpoint to a gateway.
+
+    Responses are matched by cmd to the waiting requests of their sid, or
+    to the requests sent without a sid like get_id_list, so
+    several requests share the socket and wait at the same time. A request
+    is sent again when no response comes in time, at most max_in_flight
+    requests are sent without a response.
+    """
+
+    def __init__(self, ip_adress, port, interface, timeout=DEFAULT_CMD_TIMEOUT,
+                 retries=DEFAULT_CMD_RETRIES, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+        self._address = (ip_adress, port)
+        self._interface = interface
+        self._timeout = timeout
+        self._retries = retries
+        self._max_in_flight = max_in_flight
+        self._transport = None
+        self._lock = None
+        self._in_flight = None
+        self._pending = defaultdict(list)
+
+    async def async_connect(self, loop):
+        """Open the socket once."""
+        if self._transport is not None:
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+            self._in_flight = asyncio.Semaphore(self._max_in_flight)
+
+        async with self._lock:
+            if self._transport is None:
+                local_addr = (self._interface if self._interface != 'any' else '0.0.0.0', 0)
+                await loop.create_datagram_endpoint(
+                    lambda: self, local_addr=local_addr, family=socket.AF_INET)
+
+    def close(self):
+        """Close the socket."""
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+
+    def connection_made(self, transport):
+        self._transport = transport
+
+    def connection_lost(self, exc):
+        self._transport = None
+
+    def error_received(self, exc):
+        _LOGGER.debug('Gateway socket error: %s', exc)
+
+    def datagram_received(self, data, addr):
+        if addr[0] != self._address[0]:
+            return
+
+        _LOGGER.debug("_recv_cmd >> %s", data)
+        try:
+            resp = json.loads(data.decode())
+            cmd = resp['cmd']
+        # pylint: disable=broad-except
+        except Exception:
+            _LOGGER.error('Cannot process gateway response: %s', data)
+            return
+
+        sid = _sid_key(resp.get('sid'))
+        waiters = self._pending.get(sid, [])
+        if sid is not None:
+            waiters = waiters + self._pending.get(None, [])
+        for rtn_cmds, future in waiters:
+            if not future.done() and (rtn_cmds is None or cmd in rtn_cmds):
+                future.set_result(resp)
+                return
+
+        for rtn_cmds, future in self._pending.get(sid, []) if sid else []:
+            if not future.done():
+                _LOGGER.error("Non matching response. Expecting %s, but got %s",
+                              rtn_cmds, cmd)
+                future.set_result(None)
+                return
+
+        _LOGGER.debug("Unexpected response << %s", resp)
+
+    async def async_request(self, loop, cmd, sid=None, rtn_cmds=None):
+        """Send a command and return its response, raise TimeoutError without one."""
+        sid = _sid_key(sid)
+        for attempt in range(self._retries + 1):
+            await self.async_connect(loop)
+            async with self._in_flight:
+                waiter = (rtn_cmds, loop.create_future())
+                self._pending[sid].append(waiter)
+                try:
+                    _LOGGER.debug("_send_cmd >> %s", cmd.encode())
+                    self._transport.sendto(cmd.encode(), self._address)
+                    return await asyncio.wait_for(waiter[1], self._timeout)
+                except asyncio.TimeoutError:
+                    _LOGGER.debug("No response to %s, attempt %d/%d",
+                                  cmd, attempt + 1, self._retries + 1)
+                finally:
+                    waiters = self._pending[sid]
+                    waiters.remove(waiter)
+                    if not waiters:
+                        del self._pending[sid]
+
+        raise asyncio.TimeoutError()
+
+
 class XiaomiGatewayDiscovery:
     """PyXiami."""
     # pylint: disable=too-many-instance-attributes
     GATEWAY_DISCOVERY_PORT = 4321
 
-    def __init__(self, callback_func, gateways_config, interface,
+    def __init__(self, gateways_config, interface, loop,
                  device_discovery_retries=DEFAULT_DISCOVERY_RETRIES):
 
         self.disabled_gateways = []
         self.gateways = defaultdict(list)
-        self.callback_func = callback_func
-        self._listening = False
-        self._mcastsocket = None
-        self._threads = []
+        self._loop = loop
+        self._transport = None
         self._gateways_config = gateways_config
         self._interface = interface
         self._device_discovery_retries = device_discovery_retries
@@ -96,7 +226,7 @@ class XiaomiGatewayDiscovery:
                 self.gateways[ip_address] = XiaomiGateway(
                     ip_address, sid, gateway.get('key'),
                     self._device_discovery_retries,
-                    self._interface, port, gateway.get('proto'))
+                    self._interface, port, gateway.get('proto'), self._loop)
             except OSError as error:
                 _LOGGER.error(
                     "Could not resolve %s: %s", host, error)
@@ -141,66 +271,53 @@ class XiaomiGatewayDiscovery:
                     self.gateways[ip_add] = XiaomiGateway(
                         ip_add, sid, gateway_key,
                         self._device_discovery_retries, self._interface, resp["port"],
-                        resp["proto_version"] if "proto_version" in resp else None)
+                        resp["proto_version"] if "proto_version" in resp else None,
+                        self._loop)
 
         except socket.timeout:
             _LOGGER.info("Gateway discovery finished in 5 seconds")
             _socket.close()
 
-    def listen(self):
-        """Start listening."""
+    async def async_listen(self, loop):
+        """Start listening, the reports are dispatched on the loop."""
 
         _LOGGER.info('Creating Multicast Socket')
-        self._mcastsocket = create_mcast_socket(self._interface, MULTICAST_PORT)
-        self._mcastsocket.settimeout(5.0)  # ensure you can exit the _listen_to_msg loop
-        self._listening = True
-        thread = Thread(target=self._listen_to_msg, args=())
-        self._threads.append(thread)
-        thread.daemon = True
-        thread.start()
+        sock = create_mcast_socket(self._interface, MULTICAST_PORT)
+        sock.setblocking(False)
+        self._transport, _ = await loop.create_datagram_endpoint(
+            lambda: XiaomiMulticastProtocol(self), sock=sock)
 
     def stop_listen(self):
-        """Stop listening."""
-        self._listening = False
-
-        if self._mcastsocket is not None:
+        """Stop listening, call it from the loop."""
+        if self._transport is not None:
             _LOGGER.info('Closing multisocket')
-            self._mcastsocket.close()
-            self._mcastsocket = None
+            self._transport.close()
+            self._transport = None
 
-        for thread in self._threads:
-            thread.join()
-        _LOGGER.info('Multisocket stopped')
+        for gateway in self.gateways.values():
+            gateway.close()
 
-    def _listen_to_msg(self):
-        while self._listening:
-            if self._mcastsocket is None:
-                continue
-            try:
-                data, (ip_add, _) = self._mcastsocket.recvfrom(SOCKET_BUFSIZE)
-            except socket.timeout:
-                continue
-            try:
-                data = json.loads(data.decode("ascii"))
-                gateway = self.gateways.get(ip_add)
-                if gateway is None:
-                    if ip_add not in self.disabled_gateways:
-                        _LOGGER.error('Unknown gateway ip %s', ip_add)
-                    continue
+    def handle_message(self, data, ip_add):
+        """Decode a multicast message and push it to its gateway."""
+        gateway = self.gateways.get(ip_add)
+        if gateway is None:
+            if ip_add not in self.disabled_gateways:
+                _LOGGER.error('Unknown gateway ip %s', ip_add)
+            return
 
-                cmd = data['cmd']
-                if cmd == 'heartbeat' and data['model'] in GATEWAY_MODELS:
-                    gateway.token = data['token']
-                elif cmd in ('report', 'heartbeat'):
-                    _LOGGER.debug('MCAST (%s) << %s', cmd, data)
-                    self.callback_func(gateway.push_data, data)
-                else:
-                    _LOGGER.error('Unknown multicast data: %s', data)
-            # pylint: disable=broad-except
-            except Exception:
-                _LOGGER.error('Cannot process multicast message: %s', data)
-                continue
-        _LOGGER.info('Listener stopped')
+        try:
+            data = json.loads(data.decode("ascii"))
+            cmd = data['cmd']
+            if cmd == 'heartbeat' and data['model'] in GATEWAY_MODELS:
+                gateway.token = data['token']
+            elif cmd in ('report', 'heartbeat'):
+                _LOGGER.debug('MCAST (%s) << %s', cmd, data)
+                gateway.push_data(data)
+            else:
+                _LOGGER.error('Unknown multicast data: %s', data)
+        # pylint: disable=broad-except
+        except Exception:
+            _LOGGER.error('Cannot process multicast message: %s', data)
 
 
 # pylint: disable=too-many-instance-attributes
@@ -208,7 +325,8 @@ class XiaomiGateway:
     """Xiaomi Gateway Component"""
 
     # pylint: disable=too-many-arguments
-    def __init__(self, ip_adress, sid, key, discovery_retries, interface, port=MULTICAST_PORT, proto=None):
+    def __init__(self, ip_adress, sid, key, discovery_retries, interface, port=MULTICAST_PORT, proto=None,
+                 loop=None):
 
         self.ip_adress = ip_adress
         self.port = int(port)
@@ -221,6 +339,8 @@ class XiaomiGateway:
         self.mac_error = False
         self._discovery_retries = discovery_retries
         self._interface = interface
+        self._loop = loop
+        self._transport = GatewayTransport(ip_adress, self.port, interface)
 
         if proto is None:
             cmd = '{"cmd":"read","sid":"' + sid + '"}'
@@ -234,12 +354,31 @@ class XiaomiGateway:
             if self._discover_devices():
                 break
 
-    # pylint: disable=too-many-branches
+    def _run(self, coro):
+        """Run a coroutine on the loop from a worker thread and wait for it."""
+        try:
+            in_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            in_loop = False
+        if in_loop:
+            coro.close()
+            raise RuntimeError("Use the async methods of the gateway from the event loop")
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def close(self):
+        """Close the socket of the gateway, call it from the loop."""
+        self._transport.close()
+
     def _discover_devices(self):
+        return self._run(self.async_discover_devices())
+
+    # pylint: disable=too-many-branches
+    async def async_discover_devices(self):
+        """Find the devices of the gateway, reading them all at once."""
 
         cmd = '{"cmd" : "get_id_list"}' if int(self.proto[0:1]) == 1 else '{"cmd":"discovery"}'
-        resp = self._send_cmd(cmd, "get_id_list_ack") if int(self.proto[0:1]) == 1 \
-            else self._send_cmd(cmd, "discovery_rsp")
+        resp = await self.async_send_cmd(cmd, "get_id_list_ack") if int(self.proto[0:1]) == 1 \
+            else await self.async_send_cmd(cmd, "discovery_rsp")
         if resp is None or "token" not in resp or ("data" not in resp and "dev_list" not in resp):
             return False
         self.token = resp['token']
@@ -276,13 +415,18 @@ class XiaomiGateway:
             'cover': ['curtain', 'curtain.aq2', 'curtain.hagl04'],
             'lock': ['lock.aq1', 'lock.acn02']}
 
-        for sid in sids:
+        async def _read(sid):
             cmd = '{"cmd":"read","sid":"' + sid + '"}'
+            resp = None
             for retry in range(self._discovery_retries):
                 _LOGGER.debug("Discovery attempt %d/%d", retry + 1, self._discovery_retries)
-                resp = self._send_cmd(cmd, "read_ack") if int(self.proto[0:1]) == 1 else self._send_cmd(cmd, "read_rsp")
+                resp = await self.async_send_cmd(cmd, "read_ack") if int(self.proto[0:1]) == 1 \
+                    else await self.async_send_cmd(cmd, "read_rsp")
                 if _validate_data(resp):
                     break
+            return resp
+
+        for sid, resp in zip(sids, await asyncio.gather(*[_read(sid) for sid in sids])):
             if not _validate_data(resp):
                 _LOGGER.error("Not a valid device. Check the mac adress and update the firmware.")
                 self.mac_error = True
@@ -321,33 +465,30 @@ class XiaomiGateway:
         return True
 
     def _send_cmd(self, cmd, rtn_cmd=None):
+        return self._run(self.async_send_cmd(cmd, rtn_cmd))
+
+    async def async_send_cmd(self, cmd, rtn_cmd=None):
+        """Send a command on the gateway socket and return the response."""
+        sid = json.loads(cmd).get('sid')
         try:
-            _socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            if self._interface != 'any':
-                _socket.bind((self._interface, 0))
-            _socket.settimeout(10.0)
-            _socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFSIZE)
-            _LOGGER.debug("_send_cmd >> %s", cmd.encode())
-            _socket.sendto(cmd.encode(), (self.ip_adress, self.port))
-            data, _ = _socket.recvfrom(SOCKET_BUFSIZE)
-        except socket.timeout:
+            resp = await self._transport.async_request(
+                self._loop, cmd, sid, (rtn_cmd,) if rtn_cmd is not None else None)
+        except asyncio.TimeoutError:
             _LOGGER.error("Cannot connect to Gateway")
             self.connection_error = True
             return None
-        finally:
-            _socket.close()
-        if data is None:
-            _LOGGER.error("No response from Gateway")
+        except OSError as error:
+            _LOGGER.error("Cannot send to Gateway: %s", error)
+            self.connection_error = True
             return None
-        _LOGGER.debug("_recv_cmd >> %s", data)
-        resp = json.loads(data.decode())
         _LOGGER.debug("_send_cmd resp << %s", resp)
-        if rtn_cmd is not None and resp['cmd'] != rtn_cmd:
-            _LOGGER.error("Non matching response. Expecting %s, but got %s", rtn_cmd, resp['cmd'])
-            return None
         return resp
 
     def write_to_hub(self, sid, **kwargs):
+        """Send data to gateway to turn on / off device"""
+        return self._run(self.async_write_to_hub(sid, **kwargs))
+
+    async def async_write_to_hub(self, sid, **kwargs):
         """Send data to gateway to turn on / off device"""
         if self.key is None:
             _LOGGER.error('Gateway Key is not provided. Can not send commands to the gateway.')
@@ -368,8 +509,8 @@ class XiaomiGateway:
         else:
             cmd['key'] = self._get_key()
             cmd['params'] = [data]
-        resp = self._send_cmd(json.dumps(cmd), "write_ack") if int(self.proto[0:1]) == 1 \
-            else self._send_cmd(json.dumps(cmd), "write_rsp")
+        resp = await self.async_send_cmd(json.dumps(cmd), "write_ack") if int(self.proto[0:1]) == 1 \
+            else await self.async_send_cmd(json.dumps(cmd), "write_rsp")
         _LOGGER.debug("write_ack << %s", resp)
         if _validate_data(resp):
             return True
@@ -377,8 +518,9 @@ class XiaomiGateway:
             return False
 
         # If 'invalid key' message we ask for a new token
-        resp = self._send_cmd('{"cmd" : "get_id_list"}', "get_id_list_ack") if int(self.proto[0:1]) == 1 \
-            else self._send_cmd('{"cmd" : "discovery"}', "discovery_rsp")
+        resp = await self.async_send_cmd('{"cmd" : "get_id_list"}', "get_id_list_ack") \
+            if int(self.proto[0:1]) == 1 \
+            else await self.async_send_cmd('{"cmd" : "discovery"}', "discovery_rsp")
         _LOGGER.debug("get_id_list << %s", resp)
 
         if resp is None or "token" not in resp:
@@ -391,15 +533,20 @@ class XiaomiGateway:
         else:
             cmd['key'] = self._get_key()
             cmd['params'] = [data]
-        resp = self._send_cmd(json.dumps(cmd), "write_ack") if int(self.proto[0:1]) == 1 \
-            else self._send_cmd(json.dumps(cmd), "write_rsp")
+        resp = await self.async_send_cmd(json.dumps(cmd), "write_ack") if int(self.proto[0:1]) == 1 \
+            else await self.async_send_cmd(json.dumps(cmd), "write_rsp")
         _LOGGER.debug("write_ack << %s", resp)
         return _validate_data(resp)
 
     def get_from_hub(self, sid):
+        """Get data from gateway"""
+        return self._run(self.async_get_from_hub(sid))
+
+    async def async_get_from_hub(self, sid):
         """Get data from gateway"""
         cmd = '{ "cmd":"read","sid":"' + sid + '"}'
-        resp = self._send_cmd(cmd, "read_ack") if int(self.proto[0:1]) == 1 else self._send_cmd(cmd, "read_rsp")
+        resp = await self.async_send_cmd(cmd, "read_ack") if int(self.proto[0:1]) == 1 \
+            else await self.async_send_cmd(cmd, "read_rsp")
         _LOGGER.debug("read_ack << %s", resp)
         return self.push_data(resp)
 